@@ -0,0 +1,137 @@
+"""
+Load test comparing the sync (PyMySQL in worker threads) and async (DB_ASYNC)
+database paths of the MCP tools.
+
+Every virtual session runs a slow execute_query next to fast find_user
+lookups. Head-of-line blocking shows up as high find_user latency and long
+wall time when the slow statements hold threads or connections.
+
+    python benchmarks/async_load.py --sessions 200
+    DATABASE_URL=mysql+pymysql://user:@localhost:3306/bfiber python benchmarks/async_load.py
+
+Without DATABASE_URL a temporary SQLite database is seeded and used. That
+only checks that both paths work: aiosqlite runs every statement in a thread
+of its own and SQLite serialises them, so the two modes come out about the
+same there (async find_user is often slower). Point DATABASE_URL at MySQL
+(aiomysql) to measure the difference, e.g. a throwaway container:
+
+    docker run -d --name bfiber-bench -e MYSQL_ALLOW_EMPTY_PASSWORD=yes -e MYSQL_DATABASE=bfiber -p 3306:3306 mysql:8
+    DATABASE_URL=mysql+pymysql://root:@localhost:3306/bfiber python benchmarks/async_load.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from seed import email_for, percentile, seed  # noqa: E402
+
+SLOW_QUERIES = {
+    "sqlite": (
+        "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 50000) "
+        "SELECT COUNT(*) FROM c"
+    ),
+    "mysql": "SELECT SLEEP(0.2)",
+}
+
+
+async def run_sessions(sessions, concurrency, users):
+    import main
+
+    tools = {name: getattr(getattr(main, name), "fn", getattr(main, name)) for name in ("find_user", "execute_query")}
+    backend = main.database.url.get_backend_name()
+    slow_query = SLOW_QUERIES.get(backend, SLOW_QUERIES["mysql"])
+    latencies = {"find_user": [], "execute_query": []}
+    limit = asyncio.Semaphore(concurrency)
+
+    async def timed(name, *args):
+        start = time.perf_counter()
+        await tools[name](*args)
+        latencies[name].append(time.perf_counter() - start)
+
+    async def session(i):
+        async with limit:
+            await asyncio.gather(
+                timed("execute_query", slow_query),
+                timed("find_user", email_for(i % users + 1), ""),
+            )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    wall = time.perf_counter() - start
+
+    return {
+        "mode": "async" if main.database.async_sql is not None else "sync",
+        "wall_seconds": wall,
+        "sessions_per_second": sessions / wall,
+        "tools": {
+            name: {
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+            for name, values in latencies.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = asyncio.run(run_sessions(args.sessions, args.concurrency, args.users))
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        url = os.getenv("DATABASE_URL")
+        if not url:
+            url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+            seed(url, users=args.users)
+            print(
+                "note: SQLite serialises statements and aiosqlite is thread-backed, so this run cannot show "
+                "the sync/async difference; set DATABASE_URL to a MySQL database to measure it",
+                file=sys.stderr,
+            )
+
+        results = []
+        for async_mode in ("false", "true"):
+            env = dict(os.environ, DATABASE_URL=url, DB_ASYNC=async_mode)
+            env.setdefault("DB_POOL_SIZE", "10")
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker"] + sys.argv[1:],
+                env=env,
+                cwd=workdir,
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for result in results:
+        print(
+            f"{result['mode']:>5}: wall {result['wall_seconds']:.2f}s, "
+            f"{result['sessions_per_second']:.1f} sessions/s"
+        )
+        for name, stats in result["tools"].items():
+            print(
+                f"       {name:<14} p50 {stats['p50_ms']:8.1f}ms  "
+                f"p95 {stats['p95_ms']:8.1f}ms  p99 {stats['p99_ms']:8.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare the PyTorch reference encoder with the CPU-optimised backends
+(quantized ONNX Runtime, OpenVINO): encode throughput and agreement with the
+reference embeddings.
+
+    pip install "sentence-transformers[onnx]"
+    python benchmarks/bench_embedding.py --backends torch onnx --texts 2000
+
+EMBEDDING_MODEL and EMBEDDING_MODEL_FILE are honoured like in the server.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import embedding  # noqa: E402
+from seed import FAQS  # noqa: E402
+
+
+def corpus(size):
+    questions = [question for question, _ in FAQS] + embedding.VERIFY_SAMPLES
+    return [f"{questions[i % len(questions)]} #{i}" for i in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    texts = corpus(args.texts)
+    reference = embedding.load_model(name, "torch")
+
+    for backend in args.backends:
+        start = time.perf_counter()
+        try:
+            model = reference if backend == "torch" else embedding.load_model(name, backend)
+        except Exception as e:
+            print(f"{backend:<9} unavailable: {e}")
+            continue
+        load_seconds = time.perf_counter() - start
+
+        model.encode(texts[: args.batch_size], batch_size=args.batch_size)
+        start = time.perf_counter()
+        model.encode(texts, batch_size=args.batch_size)
+        seconds = time.perf_counter() - start
+
+        min_cosine = embedding.agreement(model, reference)
+        print(
+            f"{backend:<9} load {load_seconds:6.2f}s  "
+            f"{len(texts) / seconds:8.1f} texts/s  "
+            f"{seconds / len(texts) * 1000:6.3f}ms/text  "
+            f"min cosine vs torch {min_cosine:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare the default str(rows) tool output with TOOL_OUTPUT_FORMAT=json on
+representative ticket and user queries: output size, tokens and
+serialisation time.
+
+    python benchmarks/bench_encoding.py
+    DATABASE_URL=mysql+pymysql://user:@localhost:3306/bfiber python benchmarks/bench_encoding.py
+
+Token counts use tiktoken's cl100k_base when it is installed and fall back to
+a characters / 4 estimate otherwise.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from sqlalchemy import DateTime, create_engine, text  # noqa: E402
+
+import encoding  # noqa: E402
+from seed import seed  # noqa: E402
+
+# Typed like PyMySQL returns them, so str(rows) shows datetime reprs as in production.
+QUERIES = {
+    "latest ticket": text("""
+        SELECT id, title, category, status, priority, created_at
+        FROM tickets WHERE user_id = 42 ORDER BY created_at DESC LIMIT 1
+    """).columns(created_at=DateTime),
+    "ticket history": text("""
+        SELECT id, title, category, status, priority, created_at, updated_at
+        FROM tickets WHERE user_id IN (1, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+    """).columns(created_at=DateTime, updated_at=DateTime),
+    "user page": text("""
+        SELECT id, name, email, phone_number, address, created_at FROM users LIMIT 100
+    """).columns(created_at=DateTime),
+    "open tickets join": text("""
+        SELECT t.id, u.name, u.email, t.title, t.priority, t.created_at
+        FROM tickets t JOIN users u ON u.id = t.user_id
+        WHERE t.status = 'open' LIMIT 100
+    """).columns(created_at=DateTime),
+}
+
+
+def token_counter():
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding("cl100k_base")
+        return lambda s: len(enc.encode(s)), "tiktoken cl100k_base"
+    except ImportError:
+        return lambda s: len(s) // 4, "chars/4 estimate"
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = fn()
+    return output, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    count_tokens, token_source = token_counter()
+    print(f"serializer: {'orjson' if encoding.orjson else 'json'}, tokens: {token_source}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        url = os.getenv("DATABASE_URL")
+        if not url:
+            url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+            seed(url, users=1000)
+        engine = create_engine(url)
+
+        with engine.connect() as conn:
+            for name, query in QUERIES.items():
+                result = conn.execute(query)
+                columns, rows = list(result.keys()), result.fetchall()
+
+                text_out, text_seconds = timed(lambda: str(rows), args.repeat)
+                json_out, json_seconds = timed(lambda: encoding.rows(columns, rows), args.repeat)
+                text_tokens, json_tokens = count_tokens(text_out), count_tokens(json_out)
+
+                print(f"\n{name} ({len(rows)} rows)")
+                print(f"  str(rows): {len(text_out):7d} chars {text_tokens:6d} tokens {text_seconds * 1e6:9.1f}us")
+                print(f"  json     : {len(json_out):7d} chars {json_tokens:6d} tokens {json_seconds * 1e6:9.1f}us")
+                if text_tokens:
+                    print(f"  tokens saved: {1 - json_tokens / text_tokens:.1%}")
+
+
+if __name__ == "__main__":
+    main()
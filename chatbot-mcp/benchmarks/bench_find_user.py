@@ -0,0 +1,95 @@
+"""
+Benchmark the old "email = :email OR phone_number = :phone_number" lookup
+against the per-key index seeks used by find_user, on a seeded users table.
+
+    python benchmarks/bench_find_user.py --users 1000000
+    DATABASE_URL=mysql+pymysql://user:@localhost:3306/bfiber_bench python benchmarks/bench_find_user.py
+
+Without DATABASE_URL a temporary SQLite database is seeded. With DATABASE_URL
+the users table is only seeded when it is empty.
+"""
+
+import argparse
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+import migrations  # noqa: E402
+from seed import email_for, percentile, phone_for, seed  # noqa: E402
+
+OR_QUERY = text(
+    "SELECT id, name, email, phone_number, address FROM users WHERE email = :email OR phone_number = :phone_number"
+)
+
+
+def measure(conn, query, lookups):
+    timings = []
+    for params in lookups:
+        start = time.perf_counter()
+        conn.execute(query, params).fetchall()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    print(
+        f"{label:<34} p50 {percentile(timings, 50) * 1000:8.3f}ms  "
+        f"p95 {percentile(timings, 95) * 1000:8.3f}ms  p99 {percentile(timings, 99) * 1000:8.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        url = os.getenv("DATABASE_URL") or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        engine = create_engine(url)
+        # main reads DATABASE_URL at import time and creates ./faq_db in the working directory.
+        os.environ["DATABASE_URL"] = url
+        os.chdir(workdir)
+        find_user_queries = importlib.import_module("main").FIND_USER_QUERIES
+
+        with engine.connect() as conn:
+            try:
+                populated = conn.execute(text("SELECT COUNT(*) FROM users")).scalar()
+            except Exception:
+                populated = 0
+        if not populated:
+            start = time.perf_counter()
+            seed(url, users=args.users, tickets_per_user=0)
+            print(f"seeded {args.users} users in {time.perf_counter() - start:.1f}s")
+            populated = args.users
+
+        rng = random.Random(7)
+        ids = [rng.randint(1, populated) for _ in range(args.lookups)]
+        # The prompt calls find_user(email=..., phone_number="") on every conversation.
+        email_only = [{"email": email_for(i), "phone_number": ""} for i in ids]
+        both_keys = [{"email": email_for(i), "phone_number": phone_for(i)} for i in ids]
+
+        with engine.connect() as conn:
+            report("OR query, no indexes", measure(conn, OR_QUERY, email_only[:20]))
+
+        for line in migrations.ensure_indexes(engine):
+            print(f"schema: {line}")
+
+        with engine.connect() as conn:
+            report("OR query, email only", measure(conn, OR_QUERY, email_only))
+            report("index seek, email only", measure(conn, find_user_queries[(True, False)], email_only))
+            report("OR query, email + phone", measure(conn, OR_QUERY, both_keys))
+            report("UNION ALL seeks, email + phone", measure(conn, find_user_queries[(True, True)], both_keys))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+End-to-end load test of the MCP server over streamable-http.
+
+Starts main.py against a seeded database, then replays scripted
+conversations that follow the sys_prompt.py workflow, each over its own MCP
+client session:
+
+    find_user -> get_latest_ticket (or create_user for new users)
+    -> chat_cat -> create_ticket (complaints) or search_faq (questions)
+    -> log_chat_message
+
+and reports p50/p95/p99 latency, errors and throughput per tool. The server is
+started with TOOL_OUTPUT_FORMAT=json, so a call counts as an error when it
+raises or returns an object with an "error" key; against a --server-url in
+text mode, the known failure messages ("Failed ...", "Invalid ...") are matched.
+
+    python benchmarks/loadtest.py --sessions 500 --concurrency 50
+    python benchmarks/loadtest.py --json results.json
+    python benchmarks/loadtest.py --baseline results.json --max-regression 0.2
+    DATABASE_URL=mysql+pymysql://user:@localhost:3306/bfiber_bench python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --server-url http://localhost:5000/mcp
+
+Without DATABASE_URL a temporary SQLite database is seeded. With DATABASE_URL
+the database is only seeded when its users table is empty. With --baseline the
+script exits with status 1 when a tool's p95 grew by more than
+--max-regression compared to a saved --json run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fastmcp import Client  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from seed import FAQS, email_for, percentile, seed  # noqa: E402
+
+COMPLAINTS = [
+    ("Internet mati total", "Internet saya mati total sejak pagi, tidak bisa sama sekali", "technical support", "high"),
+    ("Wifi sering putus", "Wifi kadang-kadang putus saat malam hari", "technical support", "medium"),
+    ("Tagihan tidak sesuai", "Tagihan bulan ini lebih besar dari biasanya", "billing", "medium"),
+    ("Ganti alamat", "Saya ingin update alamat pemasangan", "account management", "low"),
+    ("Minta kompensasi", "Saya minta kompensasi karena gangguan seminggu", "retention & experience", "medium"),
+]
+USER_ID = re.compile(r"ID[=:]\s*(\d+)")
+# How the tools' text-mode error strings start (see _error calls in main.py).
+FAILURE = re.compile(r"^(Failed|Invalid|ERROR|Chat history is busy|No FAQ data|Ticket \d+ does not exist|top_k must)")
+
+
+def is_failure(output):
+    if output.startswith("{"):
+        try:
+            return "error" in json.loads(output)
+        except ValueError:
+            pass
+    return FAILURE.match(output) is not None
+
+
+def user_id_in(output):
+    """
+    The user ID in a find_user / create_user response, text or JSON, or None.
+    """
+    if output.startswith("{"):
+        try:
+            payload = json.loads(output)
+        except ValueError:
+            return None
+        user = payload.get("user") or {}
+        return payload.get("user_id") or user.get("id")
+    match = USER_ID.search(output)
+    return int(match.group(1)) if match else None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_database(url, users):
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        try:
+            populated = conn.execute(text("SELECT COUNT(*) FROM users")).scalar()
+        except Exception:
+            populated = 0
+    if not populated:
+        seed(url, users=users)
+        populated = users
+    return populated
+
+
+def start_server(url, port, workdir, warmup):
+    env = dict(
+        os.environ,
+        DATABASE_URL=url,
+        MCP_PORT=str(port),
+        EMBEDDING_WARMUP=str(warmup).lower(),
+        TOOL_OUTPUT_FORMAT="json",
+    )
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "main.py")], env=env, cwd=workdir, stdout=log, stderr=log
+        )
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            with open(log_path) as log:
+                raise RuntimeError(f"server exited with {server.returncode}:\n{log.read()}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("server did not start listening within 300s")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, client, name, arguments):
+        start = time.perf_counter()
+        try:
+            result = await client.call_tool(name, arguments, raise_on_error=False)
+            output = result.content[0].text if result.content else ""
+            failed = result.is_error or is_failure(output)
+        except Exception as e:
+            failed, output = True, str(e)
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        self.errors[name] = self.errors.get(name, 0) + failed
+        return output
+
+
+async def conversation(url, recorder, rng, session, users, new_user_ratio, ticket_ratio):
+    async with Client(url) as client:
+        if rng.random() < new_user_ratio:
+            email = f"loadtest-{session}-{rng.randrange(10**9)}@example.com"
+            await recorder.call(client, "find_user", {"email": email, "phone_number": ""})
+            created = await recorder.call(
+                client,
+                "create_user",
+                {"name": f"Load {session}", "email": email, "phone_number": f"09{rng.randrange(10**10):010d}", "address": "Jl. Uji"},
+            )
+            user_id = user_id_in(created)
+        else:
+            found = await recorder.call(client, "find_user", {"email": email_for(rng.randint(1, users)), "phone_number": ""})
+            user_id = user_id_in(found)
+            if user_id is not None:
+                await recorder.call(client, "get_latest_ticket", {"user_id": user_id})
+
+        if rng.random() < ticket_ratio:
+            title, description, category, priority = rng.choice(COMPLAINTS)
+            message = description
+            await recorder.call(client, "chat_cat", {"message": message})
+            if user_id is not None:
+                await recorder.call(
+                    client,
+                    "create_ticket",
+                    {"user_id": user_id, "title": title, "description": description, "category": category, "priority": priority},
+                )
+        else:
+            message = rng.choice(FAQS)[0]
+            await recorder.call(client, "chat_cat", {"message": message})
+            await recorder.call(client, "search_faq", {"question": message})
+
+        if user_id is not None:
+            await recorder.call(
+                client,
+                "log_chat_message",
+                {"user_id": user_id, "session_id": f"loadtest-{session}", "role": "user", "message": message},
+            )
+
+
+async def run_load(url, sessions, concurrency, users, new_user_ratio, ticket_ratio, seed_value):
+    async with Client(url) as client:
+        # Index the FAQs once so search_faq answers instead of reporting an empty store.
+        await client.call_tool("save_faq_docs", {})
+
+    recorder = Recorder()
+    rng = random.Random(seed_value)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session(i):
+        async with limit:
+            await conversation(url, recorder, random.Random(rng.random()), i, users, new_user_ratio, ticket_ratio)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    wall = time.perf_counter() - start
+
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "sessions_per_second": sessions / wall,
+        "tools": {
+            name: {
+                "calls": len(values),
+                "errors": recorder.errors[name],
+                "calls_per_second": len(values) / wall,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+            for name, values in sorted(recorder.latencies.items())
+        },
+    }
+
+
+def report(result):
+    print(
+        f"{result['sessions']} sessions at concurrency {result['concurrency']}: "
+        f"wall {result['wall_seconds']:.2f}s, {result['sessions_per_second']:.1f} sessions/s"
+    )
+    for name, stats in result["tools"].items():
+        print(
+            f"  {name:<18} {stats['calls']:6d} calls  {stats['errors']:4d} errors  "
+            f"{stats['calls_per_second']:8.1f}/s  p50 {stats['p50_ms']:8.1f}ms  "
+            f"p95 {stats['p95_ms']:8.1f}ms  p99 {stats['p99_ms']:8.1f}ms"
+        )
+
+
+def regressions(result, baseline, max_regression):
+    found = []
+    for name, stats in result["tools"].items():
+        before = baseline["tools"].get(name)
+        if before and before["p95_ms"] > 0 and stats["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            found.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {stats['p95_ms']:.1f}ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--new-user-ratio", type=float, default=0.1, help="share of sessions that register a new user")
+    parser.add_argument("--ticket-ratio", type=float, default=0.5, help="share of sessions that file a ticket")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--server-url", help="load an already running server instead of starting one")
+    parser.add_argument("--no-warmup", action="store_true", help="let the first search_faq load the embedding model")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier --json run to compare p95 latencies with")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        url = args.server_url
+        users = args.users
+        if url is None:
+            database_url = os.getenv("DATABASE_URL") or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+            users = prepare_database(database_url, args.users)
+            port = free_port()
+            server = start_server(database_url, port, workdir, not args.no_warmup)
+            url = f"http://127.0.0.1:{port}/mcp"
+        try:
+            result = asyncio.run(
+                run_load(url, args.sessions, args.concurrency, users, args.new_user_ratio, args.ticket_ratio, args.seed)
+            )
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(result, json.load(f), args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+SQLite stand-in for the BFiber MySQL schema, shared by the benchmark scripts.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name VARCHAR(50),
+        phone_number VARCHAR(18),
+        email VARCHAR(50),
+        address TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tickets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER REFERENCES users(id),
+        title TEXT,
+        description TEXT,
+        category VARCHAR(25),
+        status VARCHAR(20),
+        priority VARCHAR(15),
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS faq_docs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question TEXT,
+        answer TEXT,
+        category VARCHAR(25),
+        created_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ticket_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ticket_id INTEGER REFERENCES tickets(id),
+        action VARCHAR(15),
+        old_value TEXT,
+        new_value TEXT,
+        created_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER REFERENCES users(id),
+        session_id VARCHAR(100),
+        role VARCHAR(15),
+        message TEXT,
+        created_at TIMESTAMP
+    )
+    """,
+]
+
+CATEGORIES = ["technical support", "billing", "account management", "retention & experience"]
+PRIORITIES = ["low", "medium", "high"]
+STATUSES = ["open", "in_progress", "resolved"]
+
+FAQS = [
+    ("Bagaimana cara registrasi layanan BFiber?", "Registrasi bisa dilakukan lewat aplikasi atau website BFiber."),
+    ("Apa saja promo yang sedang berlaku?", "Promo terbaru dapat dilihat di halaman promo aplikasi BFiber."),
+    ("Apakah alamat saya masuk jangkauan BFiber?", "Cek coverage dengan memasukkan alamat di halaman jangkauan."),
+    ("Apa saja list paket internet BFiber?", "Tersedia paket 30, 50, 100 dan 300 Mbps."),
+    ("Metode pembayaran apa saja yang tersedia?", "Pembayaran bisa lewat transfer bank, e-wallet dan minimarket."),
+    ("Kenapa wifi saya mati?", "Coba restart modem, jika masih mati buat tiket technical support."),
+    ("Bagaimana cara cek tagihan bulan ini?", "Tagihan bisa dilihat di menu billing pada aplikasi BFiber."),
+    ("Bagaimana cara berhenti berlangganan?", "Hubungi customer service untuk proses berhenti berlangganan."),
+]
+
+
+def email_for(i):
+    return f"user{i}@example.com"
+
+
+def phone_for(i):
+    return f"08{i:010d}"
+
+
+def create_schema(url):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    return engine
+
+
+def seed(url, users=1000, tickets_per_user=3, batch_size=10000):
+    """
+    Create the schema and fill it with deterministic users, tickets and FAQs.
+    """
+    engine = create_schema(url)
+    rng = random.Random(42)
+    start = datetime(2025, 1, 1)
+
+    with engine.begin() as conn:
+        for offset in range(0, users, batch_size):
+            conn.execute(
+                text("""
+                INSERT INTO users (name, email, phone_number, address, created_at, updated_at)
+                VALUES (:name, :email, :phone_number, :address, :now, :now)
+                """),
+                [
+                    {
+                        "name": f"User {i}",
+                        "email": email_for(i),
+                        "phone_number": phone_for(i),
+                        "address": f"Jl. Contoh No. {i}",
+                        "now": start,
+                    }
+                    for i in range(offset + 1, min(offset + batch_size, users) + 1)
+                ],
+            )
+
+        ticket_rows = []
+        for user_id in range(1, users + 1):
+            for n in range(tickets_per_user):
+                created = start + timedelta(days=n, minutes=rng.randrange(1440))
+                ticket_rows.append(
+                    {
+                        "user_id": user_id,
+                        "title": f"Masalah {n} user {user_id}",
+                        "description": "Internet lambat sejak pagi",
+                        "category": rng.choice(CATEGORIES),
+                        "status": rng.choice(STATUSES),
+                        "priority": rng.choice(PRIORITIES),
+                        "now": created,
+                    }
+                )
+            if ticket_rows and (len(ticket_rows) >= batch_size or user_id == users):
+                conn.execute(
+                    text("""
+                    INSERT INTO tickets (user_id, title, description, category, status, priority, created_at, updated_at)
+                    VALUES (:user_id, :title, :description, :category, :status, :priority, :now, :now)
+                    """),
+                    ticket_rows,
+                )
+                ticket_rows = []
+
+        conn.execute(
+            text("INSERT INTO faq_docs (question, answer, created_at) VALUES (:question, :answer, :now)"),
+            [{"question": q, "answer": a, "now": start} for q, a in FAQS],
+        )
+    return engine
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,110 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory inverted index over FAQ question + answer text, scored with Okapi BM25.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.docs
+
+    def add(self, doc_id, question, answer):
+        terms = Counter(tokenize(f"{question} {answer}"))
+        with self._lock:
+            self._remove(doc_id)
+            length = sum(terms.values())
+            self.docs[doc_id] = {"question": question, "answer": answer, "terms": dict(terms), "length": length}
+            self.total_length += length
+            for term, frequency in terms.items():
+                self.postings[term][doc_id] = frequency
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for term in doc["terms"]:
+            posting = self.postings[term]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+
+    def search(self, query, top_k=3):
+        """
+        Return up to top_k (doc_id, score, matched_terms) sorted by score, where
+        matched_terms is how many distinct query terms the document contains.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self.docs)
+            if not count or not terms:
+                return []
+            average_length = self.total_length / count
+            scores = defaultdict(float)
+            matched = Counter()
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, frequency in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.docs[doc_id]["length"] / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+                    matched[doc_id] += 1
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(doc_id, score, matched[doc_id]) for doc_id, score in ranked]
+
+    def document(self, doc_id):
+        doc = self.docs.get(doc_id)
+        return (doc["question"], doc["answer"]) if doc else (None, None)
+
+    def save(self, path):
+        with self._lock:
+            payload = {
+                "k1": self.k1,
+                "b": self.b,
+                "docs": {doc_id: {"question": d["question"], "answer": d["answer"]} for doc_id, d in self.docs.items()},
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        index.k1, index.b = payload.get("k1", index.k1), payload.get("b", index.b)
+        for doc_id, doc in payload["docs"].items():
+            index.add(doc_id, doc["question"], doc["answer"])
+        return index
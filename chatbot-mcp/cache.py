@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire ttl seconds after being set.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SemanticCache:
+    """
+    Bounded cache keyed by embedding vectors.
+
+    A lookup hits when a stored vector lies within max_distance cosine
+    distance of the query vector. Vectors are kept normalised in one matrix,
+    so a lookup is a single matrix-vector product over at most maxsize rows;
+    when full, the least recently used row is overwritten. Entries carry an
+    integer tag (e.g. the number of results stored) and only match lookups
+    with the same tag.
+    """
+
+    def __init__(self, maxsize=512, max_distance=0.05, ttl=600):
+        self.maxsize = maxsize
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._values = [None] * maxsize
+        self._expires = np.zeros(maxsize)
+        self._last_used = np.zeros(maxsize)
+        self._tags = np.zeros(maxsize, dtype=np.int64)
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector, default=None, tag=0):
+        query = self._normalise(vector)
+        with self._lock:
+            now = time.monotonic()
+            if self._vectors is not None:
+                live = (self._expires > now) & (self._tags == tag)
+                if live.any():
+                    similarity = np.where(live, self._vectors @ query, -np.inf)
+                    best = int(np.argmax(similarity))
+                    if 1 - similarity[best] <= self.max_distance:
+                        self._clock += 1
+                        self._last_used[best] = self._clock
+                        self.hits += 1
+                        return self._values[best]
+            self.misses += 1
+            return default
+
+    def set(self, vector, value, tag=0):
+        vector = self._normalise(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            now = time.monotonic()
+            # Reuse an expired or empty slot first, otherwise evict the least recently used one.
+            expired = np.flatnonzero(self._expires <= now)
+            slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._values[slot] = value
+            self._tags[slot] = tag
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = self._clock
+
+    def clear(self):
+        with self._lock:
+            self._values = [None] * self.maxsize
+            self._expires[:] = 0
+            self._last_used[:] = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int((self._expires > time.monotonic()).sum()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+INSERT_MESSAGES = text("""
+    INSERT INTO chat_history (user_id, session_id, role, message, created_at)
+    VALUES (:user_id, :session_id, :role, :message, :created_at)
+""")
+
+
+class ChatHistoryWriter:
+    """
+    Queue chat_history rows in memory and write them in batches from a
+    background thread.
+
+    A batch is flushed when it reaches batch_size rows or flush_interval
+    seconds after its first row arrived. The queue is bounded: when MySQL falls
+    behind, log() waits up to put_timeout for room and then reports the message
+    as dropped instead of letting the backlog grow without limit.
+    """
+
+    def __init__(self, engine, batch_size=100, flush_interval=1.0, max_queue=10000, put_timeout=0.5, retries=3):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "write_seconds": 0.0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+                self._thread.start()
+
+    def log(self, user_id, session_id, role, message):
+        """
+        Queue one message. Returns False if the queue stayed full for put_timeout.
+        """
+        self.start()
+        row = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "role": role,
+            "message": message,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            self._count("dropped", 1)
+            return False
+        self._count("queued", 1)
+        return True
+
+    def close(self, timeout=10.0):
+        """
+        Stop the writer after flushing everything already queued.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["pending"] = self._queue.qsize()
+        return snapshot
+
+    def _count(self, key, amount):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                # Past the deadline, or shutting down, only take rows already queued.
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows):
+        start = time.perf_counter()
+        with self.engine.begin() as conn:
+            conn.execute(INSERT_MESSAGES, rows)
+        with self._lock:
+            self._stats["written"] += len(rows)
+            self._stats["batches"] += 1
+            self._stats["write_seconds"] += time.perf_counter() - start
+
+    def _write(self, batch):
+        """
+        Insert batch, retrying connection and lock errors. Any other database
+        error (a constraint or a bad value) comes from the rows themselves and
+        would fail again, so the batch is written row by row instead and only
+        the rows the database rejects count as failed.
+        """
+        for attempt in range(self.retries):
+            try:
+                self._insert(batch)
+                return
+            except (OperationalError, InterfaceError):
+                time.sleep(min(2 ** attempt * 0.5, 5))
+            except DBAPIError:
+                break
+        else:
+            self._count("failed", len(batch))
+            return
+        for row in batch:
+            try:
+                self._insert([row])
+            except DBAPIError:
+                self._count("failed", 1)
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
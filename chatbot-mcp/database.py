@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import anyio
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import metrics
+from cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Sync driver -> async driver used when DB_ASYNC is enabled.
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def database_url():
+    return os.getenv("DATABASE_URL") or (
+        f"mysql+pymysql://{os.getenv('DB_USER')}:@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+    )
+
+
+def replica_url():
+    """
+    URL of the optional read replica: DATABASE_REPLICA_URL, or the primary's
+    MySQL settings with DB_REPLICA_HOST (and DB_REPLICA_PORT). None if unset.
+    """
+    if os.getenv("DATABASE_REPLICA_URL"):
+        return os.getenv("DATABASE_REPLICA_URL")
+    if os.getenv("DB_REPLICA_HOST"):
+        port = os.getenv("DB_REPLICA_PORT") or os.getenv("DB_PORT")
+        return f"mysql+pymysql://{os.getenv('DB_USER')}:@{os.getenv('DB_REPLICA_HOST')}:{port}/{os.getenv('DB_NAME')}"
+    return None
+
+
+def engine_options(url):
+    options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        # Keep below MySQL's wait_timeout so the pool never hands out a connection the server already closed.
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": env_bool("DB_POOL_PRE_PING", True),
+    }
+    if url.get_backend_name() == "mysql":
+        options["connect_args"] = {"connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "10"))}
+    return options
+
+
+def create_async_sql(url):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    return create_async_engine(async_url, **engine_options(async_url))
+
+
+url = make_url(database_url())
+sql = create_engine(url, **engine_options(url))
+async_sql = create_async_sql(url) if env_bool("DB_ASYNC", False) else None
+
+replica = make_url(replica_url()) if replica_url() else None
+replica_sql = create_engine(replica, **engine_options(replica)) if replica is not None else None
+async_replica_sql = create_async_sql(replica) if replica is not None and async_sql is not None else None
+
+for engine in (sql, async_sql, replica_sql, async_replica_sql):
+    if engine is not None:
+        metrics.instrument_engine(getattr(engine, "sync_engine", engine))
+
+# Sessions (and users) written recently read from the primary until the replica has caught up.
+STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+_pinned = TTLCache(maxsize=100000, ttl=STICKY_SECONDS)
+# With several server processes the read after a write can land in another one,
+# so pins are also kept as files in this directory, shared by all of them
+# (main.py --workers). A pin file is live while its mtime is within STICKY_SECONDS.
+PINS_DIR = os.getenv("DB_REPLICA_PINS_DIR")
+PINS_PRUNE_SECONDS = 60
+_last_prune = 0.0
+# Send every read that carries sticky keys to the primary, pinned or not.
+STICKY_PRIMARY = env_bool("DB_REPLICA_STICKY_PRIMARY", False)
+
+_lock = threading.Lock()
+_checkout_stats = {
+    "checkouts": 0,
+    "timeouts": 0,
+    "wait_seconds": 0.0,
+    "max_wait_seconds": 0.0,
+    "replica_fallbacks": 0,
+}
+
+
+@contextmanager
+def connect(engine=sql):
+    """
+    Check a connection out of the pool, recording how long the checkout waited.
+    If the replica can't hand out a connection, the primary is used instead.
+    """
+    start = time.perf_counter()
+    try:
+        conn = engine.connect()
+    except Exception as e:
+        if engine is not replica_sql:
+            _count_failure(e)
+            raise
+        _count_fallback()
+        conn = sql.connect()
+    _record_checkout(time.perf_counter() - start)
+
+    with conn:
+        yield conn
+
+
+def _record_checkout(waited):
+    with _lock:
+        _checkout_stats["checkouts"] += 1
+        _checkout_stats["wait_seconds"] += waited
+        _checkout_stats["max_wait_seconds"] = max(_checkout_stats["max_wait_seconds"], waited)
+
+
+def pin(*keys):
+    """
+    Route reads tagged with any of keys (a session id, a user) to the primary
+    for STICKY_SECONDS after a write, so they see it despite replication lag.
+    """
+    if replica_sql is not None:
+        for key in keys:
+            if key:
+                _pinned.set(key, True)
+                if PINS_DIR:
+                    _share_pin(key)
+        if PINS_DIR:
+            _prune_pins()
+
+
+def _pin_path(key):
+    return os.path.join(PINS_DIR, hashlib.sha1(repr(key).encode("utf-8")).hexdigest())
+
+
+def _share_pin(key):
+    path = _pin_path(key)
+    try:
+        with open(path, "a"):
+            pass
+        os.utime(path)
+    except OSError as e:
+        logger.warning("could not share replica pin in %s: %s", PINS_DIR, e)
+
+
+def _prune_pins():
+    """
+    Remove expired pin files, at most once per PINS_PRUNE_SECONDS.
+    """
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < PINS_PRUNE_SECONDS:
+        return
+    _last_prune = now
+    try:
+        for entry in os.scandir(PINS_DIR):
+            try:
+                if entry.stat().st_mtime < now - STICKY_SECONDS:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # removed by another process
+    except OSError as e:
+        logger.warning("could not prune replica pins in %s: %s", PINS_DIR, e)
+
+
+def _is_pinned(key):
+    if _pinned.get(key):
+        return True
+    if not PINS_DIR:
+        return False
+    try:
+        return os.stat(_pin_path(key)).st_mtime >= time.time() - STICKY_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+def read_engine(sticky=()):
+    """
+    Engine for a read-only query: the replica, unless none is configured or
+    one of the sticky keys was pinned within STICKY_SECONDS, by this process
+    or, with PINS_DIR, by any other (or given at all, with STICKY_PRIMARY).
+    """
+    if replica_sql is None or (STICKY_PRIMARY and any(sticky)):
+        return sql
+    if any(key and _is_pinned(key) for key in sticky):
+        return sql
+    return replica_sql
+
+
+async def run(fn, *args, read_only=False, sticky=()):
+    """
+    Call fn(conn, *args) without blocking the event loop.
+
+    With DB_ASYNC enabled fn runs on the async engine through run_sync, so the
+    driver awaits the network instead of holding a thread. Otherwise fn runs
+    on the sync engine in a worker thread. read_only calls go to the replica
+    (see read_engine) and fall back to the primary if it can't be reached.
+    """
+    engine = read_engine(sticky) if read_only else sql
+    if async_sql is None:
+        return await anyio.to_thread.run_sync(_run_sync, fn, args, engine)
+
+    async_engine = async_replica_sql if engine is replica_sql else async_sql
+    start = time.perf_counter()
+    try:
+        conn = await async_engine.connect().start()
+    except Exception as e:
+        if async_engine is not async_replica_sql:
+            _count_failure(e)
+            raise
+        _count_fallback()
+        conn = await async_sql.connect().start()
+    _record_checkout(time.perf_counter() - start)
+
+    try:
+        return await conn.run_sync(fn, *args)
+    finally:
+        await conn.close()
+
+
+def _run_sync(fn, args, engine=sql):
+    with connect(engine) as conn:
+        return fn(conn, *args)
+
+
+def _count_failure(error):
+    if isinstance(error, PoolTimeoutError):
+        with _lock:
+            _checkout_stats["timeouts"] += 1
+
+
+def _count_fallback():
+    with _lock:
+        _checkout_stats["replica_fallbacks"] += 1
+
+
+def pool_status(engine=None):
+    if engine is None:
+        engine = async_sql if async_sql is not None else sql
+    engine = getattr(engine, "sync_engine", engine)
+    pool = engine.pool
+    with _lock:
+        stats = dict(_checkout_stats)
+    stats.update(
+        {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+        }
+    )
+    stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    return stats
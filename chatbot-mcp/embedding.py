@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+import metrics
+
+# Quantized model files shipped in the sentence-transformers/all-MiniLM-L6-v2 repo.
+DEFAULT_MODEL_FILES = {
+    "onnx": "onnx/model_qint8_avx2.onnx",
+    "openvino": "openvino/openvino_model_qint8_quantized.xml",
+}
+
+# Short support-style queries used to check a backend against the reference model.
+VERIFY_SAMPLES = [
+    "wifi mati",
+    "internet lambat sejak pagi",
+    "tagihan bulan ini belum muncul",
+    "bagaimana cara upgrade paket?",
+    "modem tidak bisa login",
+    "saya ingin berhenti berlangganan",
+    "apakah alamat saya masuk jangkauan?",
+    "metode pembayaran apa saja yang tersedia",
+]
+
+_model = None
+_lock = threading.Lock()
+_stats = {
+    "model": None,
+    "backend": None,
+    "min_cosine_vs_reference": None,
+    "load_seconds": None,
+    "encode_calls": 0,
+    "encoded_texts": 0,
+    "encode_seconds": 0.0,
+}
+
+
+def get_model():
+    """
+    Return the process-wide SentenceTransformer, loading it on first use.
+    """
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+                backend = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+                start = time.perf_counter()
+                model = load_model(name, backend)
+                if backend != "torch" and os.getenv("EMBEDDING_VERIFY", "true").lower() == "true":
+                    reference = SentenceTransformer(name)
+                    min_cosine = agreement(model, reference)
+                    _stats["min_cosine_vs_reference"] = min_cosine
+                    if min_cosine < float(os.getenv("EMBEDDING_VERIFY_MIN_COSINE", "0.99")):
+                        # Too far from the reference embeddings already stored in Chroma: use the reference model.
+                        backend, model = "torch", reference
+                _model = model
+                _stats["model"] = name
+                _stats["backend"] = backend
+                _stats["load_seconds"] = time.perf_counter() - start
+    return _model
+
+
+def load_model(name, backend="torch"):
+    """
+    Load name on the given backend: torch, or onnx / openvino for CPU-optimised
+    inference (needs sentence-transformers[onnx] or [openvino]).
+    """
+    if backend == "torch":
+        return SentenceTransformer(name)
+    if backend not in DEFAULT_MODEL_FILES:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Must be one of: torch, onnx, openvino")
+    file_name = os.getenv("EMBEDDING_MODEL_FILE", DEFAULT_MODEL_FILES[backend])
+    return SentenceTransformer(name, backend=backend, model_kwargs={"file_name": file_name})
+
+
+def agreement(model, reference, samples=VERIFY_SAMPLES):
+    """
+    Return the lowest cosine similarity between model and reference embeddings of samples.
+    """
+    actual = model.encode(samples, normalize_embeddings=True)
+    expected = reference.encode(samples, normalize_embeddings=True)
+    return float(np.min(np.sum(np.asarray(actual) * np.asarray(expected), axis=1)))
+
+
+def encode(texts, batch_size=32):
+    """
+    Encode a list of texts with the shared model and record throughput.
+    """
+    model = get_model()
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    metrics.record_phase("embedding", elapsed)
+
+    with _lock:
+        _stats["encode_calls"] += 1
+        _stats["encoded_texts"] += len(texts)
+        _stats["encode_seconds"] += elapsed
+    return vectors
+
+
+def warm_up():
+    """
+    Load the model and run one tiny encode so the first request pays nothing.
+    """
+    encode(["warm up"])
+    return _stats["load_seconds"]
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+    seconds = snapshot["encode_seconds"]
+    snapshot["texts_per_second"] = snapshot["encoded_texts"] / seconds if seconds else 0.0
+    return snapshot
@@ -0,0 +1,56 @@
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# "text" keeps the original human-readable strings; "json" returns compact typed JSON.
+OUTPUT_FORMAT = os.getenv("TOOL_OUTPUT_FORMAT", "text").strip().lower()
+
+
+def structured():
+    return OUTPUT_FORMAT == "json"
+
+
+def _compact(value):
+    if isinstance(value, Decimal):
+        if value == value.to_integral_value():
+            return int(value)
+        as_float = float(value)
+        return as_float if Decimal(repr(as_float)) == value else str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds" if value.microsecond == 0 else "auto")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """
+    Serialise data as compact JSON: no whitespace, unescaped unicode,
+    "YYYY-MM-DD HH:MM:SS" datetimes and decimals as numbers when exact.
+    """
+    if orjson is not None:
+        # orjson's native datetime output is RFC 3339 with microseconds; route
+        # them through _compact too so both serialisers produce the same text.
+        return orjson.dumps(data, default=_compact, option=orjson.OPT_PASSTHROUGH_DATETIME).decode("utf-8")
+    return json.dumps(data, default=_compact, ensure_ascii=False, separators=(",", ":"))
+
+
+def rows(columns, records, **extra):
+    """
+    Column names once, then one positional array per row.
+    """
+    payload = {"columns": list(columns), "rows": [list(record) for record in records]}
+    payload.update(extra)
+    return dumps(payload)
+
+
+def record(columns, values):
+    return dict(zip(columns, values))
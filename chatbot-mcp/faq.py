@@ -0,0 +1,259 @@
+import hashlib
+import os
+import time
+
+from sqlalchemy import text
+
+import bm25
+import embedding
+import metrics
+from cache import SemanticCache, TTLCache
+
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper.
+RRF_K = 60
+
+BM25_PATH = os.getenv("FAQ_BM25_PATH", "./faq_bm25.json")
+
+embedding_cache = TTLCache(
+    maxsize=int(os.getenv("FAQ_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("FAQ_CACHE_TTL", "600")),
+)
+result_cache = TTLCache(
+    maxsize=int(os.getenv("FAQ_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("FAQ_CACHE_TTL", "600")),
+)
+# Vector search results of recent queries, reused for near-identical wording.
+semantic_cache = SemanticCache(
+    maxsize=int(os.getenv("FAQ_SEMANTIC_CACHE_SIZE", "512")),
+    max_distance=float(os.getenv("FAQ_SEMANTIC_CACHE_DISTANCE", "0.05")),
+    ttl=float(os.getenv("FAQ_CACHE_TTL", "600")),
+)
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+lexical_index = bm25.BM25Index.load(BM25_PATH)
+_lexical_version = _file_version(BM25_PATH)
+
+
+def reload_if_changed():
+    """
+    Reload the BM25 index when another worker's sync rewrote the file. Its
+    cached results are dropped too, since that sync also changed Chroma.
+    """
+    global lexical_index, _lexical_version
+    version = _file_version(BM25_PATH)
+    if version != _lexical_version:
+        lexical_index = bm25.BM25Index.load(BM25_PATH)
+        _lexical_version = version
+        invalidate()
+
+
+def invalidate():
+    result_cache.clear()
+    semantic_cache.clear()
+
+
+def content_hash(question, answer):
+    return hashlib.sha256(f"{question}\x1f{answer}".encode("utf-8")).hexdigest()
+
+
+def _collection_ids(collection, page_size):
+    offset = 0
+    while True:
+        with metrics.phase("chroma"):
+            page = collection.get(include=[], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield from page["ids"]
+        offset += len(page["ids"])
+
+
+def _upsert(collection, ids, questions, metadatas, vectors, max_batch_size):
+    for start in range(0, len(ids), max_batch_size):
+        end = start + max_batch_size
+        with metrics.phase("chroma"):
+            collection.upsert(
+                ids=ids[start:end],
+                documents=questions[start:end],
+                metadatas=metadatas[start:end],
+                embeddings=vectors[start:end].tolist(),
+            )
+
+
+def sync(conn, collection, batch_size=None, max_batch_size=None):
+    """
+    Bring the Chroma collection in line with the faq_docs table.
+
+    Documents are keyed by faq_docs.id and carry a hash of their content,
+    so only new or edited rows are embedded and deleted rows are removed.
+    Rows are streamed from a server-side cursor and processed batch_size at
+    a time, so memory stays bounded by the batch size, not the table size.
+    """
+    global _lexical_version
+    reload_if_changed()
+    batch_size = batch_size or int(os.getenv("FAQ_BATCH_SIZE", "256"))
+    max_batch_size = min(batch_size, max_batch_size or batch_size)
+
+    report = {
+        "total": 0,
+        "added": 0,
+        "updated": 0,
+        "removed": 0,
+        "skipped": 0,
+        "batches": 0,
+        "encode_seconds": 0.0,
+        "seconds": 0.0,
+    }
+    started = time.perf_counter()
+    seen_ids = set()
+    lexical_changed = False
+
+    result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(
+        text("SELECT id, question, answer FROM faq_docs ORDER BY id")
+    )
+    for rows in result.partitions(batch_size):
+        metrics.add_rows(len(rows))
+        report["batches"] += 1
+        report["total"] += len(rows)
+
+        batch_ids = [str(row[0]) for row in rows]
+        seen_ids.update(batch_ids)
+        with metrics.phase("chroma"):
+            existing = collection.get(ids=batch_ids, include=["metadatas"])
+        known_hashes = {
+            doc_id: (metadata or {}).get("hash")
+            for doc_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+
+        ids, questions, metadatas = [], [], []
+        for doc_id, (_, question, answer) in zip(batch_ids, rows):
+            digest = content_hash(question, answer)
+            if doc_id not in known_hashes:
+                report["added"] += 1
+            elif known_hashes[doc_id] != digest:
+                report["updated"] += 1
+            else:
+                report["skipped"] += 1
+                # Unchanged vectors still need a lexical entry, e.g. right after the index file was removed.
+                if doc_id not in lexical_index:
+                    lexical_index.add(doc_id, question, answer)
+                    lexical_changed = True
+                continue
+            lexical_index.add(doc_id, question, answer)
+            lexical_changed = True
+            ids.append(doc_id)
+            questions.append(question)
+            metadatas.append({"answer": answer, "hash": digest})
+
+        if ids:
+            start = time.perf_counter()
+            vectors = embedding.encode(questions, batch_size=batch_size)
+            report["encode_seconds"] += time.perf_counter() - start
+            _upsert(collection, ids, questions, metadatas, vectors, max_batch_size)
+
+    if report["added"] or report["updated"]:
+        invalidate()
+
+    stale_ids = [doc_id for doc_id in _collection_ids(collection, batch_size) if doc_id not in seen_ids]
+    for start in range(0, len(stale_ids), max_batch_size):
+        with metrics.phase("chroma"):
+            collection.delete(ids=stale_ids[start:start + max_batch_size])
+    report["removed"] = len(stale_ids)
+    if stale_ids:
+        invalidate()
+
+    for doc_id in list(lexical_index.docs):
+        if doc_id not in seen_ids:
+            lexical_index.remove(doc_id)
+            lexical_changed = True
+    if lexical_changed:
+        lexical_index.save(BM25_PATH)
+        _lexical_version = _file_version(BM25_PATH)
+
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+
+def normalize_query(question):
+    return " ".join(question.lower().split())
+
+
+def _vector_search(collection, key, top_k):
+    vector = embedding_cache.get(key)
+    if vector is None:
+        vector = embedding.encode([key])[0].tolist()
+        embedding_cache.set(key, vector)
+
+    cached = semantic_cache.get(vector, tag=top_k)
+    if cached is not None:
+        return cached
+
+    with metrics.phase("chroma"):
+        found = collection.query(
+            query_embeddings=[vector],
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"],
+        )
+    results = [
+        {
+            "id": doc_id,
+            "question": document,
+            "answer": (metadata or {}).get("answer"),
+            "distance": distance,
+        }
+        for doc_id, document, metadata, distance in zip(
+            found["ids"][0], found["documents"][0], found["metadatas"][0], found["distances"][0]
+        )
+    ]
+    semantic_cache.set(vector, results, tag=top_k)
+    return results
+
+
+def _lexical_result(doc_id, score):
+    question, answer = lexical_index.document(doc_id)
+    return {"id": doc_id, "question": question, "answer": answer, "distance": None, "score": score}
+
+
+def _fuse(lexical, semantic, top_k):
+    scores = {}
+    results = {}
+    for rank, (doc_id, _, _) in enumerate(lexical):
+        scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (RRF_K + rank + 1)
+        results[doc_id] = _lexical_result(doc_id, 0.0)
+    for rank, result in enumerate(semantic):
+        scores[result["id"]] = scores.get(result["id"], 0.0) + 1 / (RRF_K + rank + 1)
+        results[result["id"]] = dict(result)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [dict(results[doc_id], score=scores[doc_id]) for doc_id in ranked]
+
+
+def search(collection, question, top_k=3):
+    """
+    Return the top_k FAQ entries for question, fusing BM25 and vector ranks.
+
+    When the best lexical hit contains every query keyword the embedding call
+    and the Chroma query are skipped. Query embeddings and results are cached
+    by normalised question text; results are dropped whenever sync changes
+    the collection.
+    """
+    reload_if_changed()
+    key = normalize_query(question)
+    results = result_cache.get((key, top_k))
+    if results is not None:
+        return results
+
+    lexical = lexical_index.search(key, top_k)
+    if lexical and lexical[0][2] == len(set(bm25.tokenize(key))):
+        results = [_lexical_result(doc_id, score) for doc_id, score, _ in lexical]
+    else:
+        results = _fuse(lexical, _vector_search(collection, key, top_k), top_k)
+
+    result_cache.set((key, top_k), results)
+    return results
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+import embedding
+from cache import TTLCache
+
+# Labelled examples the intent centroids are built from. INTENT_EXAMPLES_PATH can
+# point at a JSON file of the same shape to add more examples per label.
+EXAMPLES = {
+    "complaint": [
+        "internet saya mati total sejak pagi",
+        "wifi sering putus-putus",
+        "koneksi lambat sekali padahal sudah restart modem",
+        "tagihan saya bulan ini tidak sesuai",
+        "saya sudah bayar tapi layanan masih di-suspend",
+        "modem tidak bisa login",
+        "sinyal hilang terus dari kemarin",
+        "saya mau refund, layanannya mengecewakan",
+        "teknisi belum datang padahal sudah janji",
+        "my internet has been down all day",
+        "the connection keeps dropping",
+        "I was charged twice on my invoice",
+    ],
+    "question": [
+        "apa saja list paket internet BFiber?",
+        "bagaimana cara registrasi?",
+        "apakah alamat saya masuk jangkauan?",
+        "metode pembayaran apa saja yang tersedia?",
+        "promo apa yang sedang berlaku?",
+        "bagaimana cara upgrade paket?",
+        "berapa harga paket 100 Mbps?",
+        "kapan jatuh tempo pembayaran tagihan?",
+        "how do I change my plan?",
+        "what payment methods do you accept?",
+    ],
+    "chitchat": [
+        "halo",
+        "selamat pagi",
+        "terima kasih banyak",
+        "oke siap",
+        "apa kabar?",
+        "sampai jumpa",
+        "kamu bot ya?",
+        "hehe makasih ya",
+        "hello there",
+        "thanks, that's all",
+    ],
+}
+
+# Keyword rules from the STEP 3 section of sys_prompt.py. Every label except
+# "faq" is a tickets.category value; "faq" keywords mark questions for
+# search_faq and stay in the rules so "list paket internet" doesn't match
+# "internet", but classify() reports no category for them.
+CATEGORY_KEYWORDS = {
+    "technical support": ["internet", "lambat", "disconnect", "wifi", "modem", "3rd party", "restart", "login", "progress"],
+    "billing": ["tagihan", "billing", "bayar", "invoice", "suspend"],
+    "faq": ["registrasi", "promo", "jangkauan", "coverage", "list paket", "metode pembayaran"],
+    "account management": ["alamat", "update", "upgrade", "downgrade", "add-on"],
+    "retention & experience": ["refund", "kompensasi", "berhenti berlangganan"],
+}
+NON_TICKET_CATEGORIES = {"faq"}
+PRIORITY_KEYWORDS = {
+    "high": ["tidak bisa sama sekali", "mati total", "darurat"],
+    "medium": ["kadang-kadang", "sering putus", "lumayan lambat"],
+    "low": ["sedikit lambat", "sesekali"],
+}
+
+_labels = None
+_centroids = None
+_lock = threading.Lock()
+label_cache = TTLCache(
+    maxsize=int(os.getenv("INTENT_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("INTENT_CACHE_TTL", "3600")),
+)
+
+
+def load_examples(path=None):
+    """
+    Return EXAMPLES merged with the labelled examples in the JSON file at path.
+    """
+    examples = {label: list(texts) for label, texts in EXAMPLES.items()}
+    path = path or os.getenv("INTENT_EXAMPLES_PATH")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for label, texts in json.load(f).items():
+                examples.setdefault(label, []).extend(texts)
+    return examples
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def train(examples=None):
+    """
+    Build one normalised centroid per label from the example embeddings.
+    """
+    global _labels, _centroids
+    examples = examples or load_examples()
+    labels = sorted(examples)
+    texts = [text for label in labels for text in examples[label]]
+    vectors = _normalise(embedding.encode(texts))
+    centroids, start = [], 0
+    for label in labels:
+        count = len(examples[label])
+        centroids.append(vectors[start:start + count].mean(axis=0))
+        start += count
+    with _lock:
+        _labels, _centroids = labels, _normalise(centroids)
+        label_cache.clear()
+
+
+def _model():
+    if _centroids is None:
+        train()
+    return _labels, _centroids
+
+
+def match_keyword(message, rules):
+    """
+    Return the rule whose longest keyword occurs in message, so "list paket
+    internet" is faq rather than technical support.
+    """
+    lowered = message.lower()
+    best, best_length = None, 0
+    for label, keywords in rules.items():
+        for keyword in keywords:
+            if len(keyword) > best_length and keyword in lowered:
+                best, best_length = label, len(keyword)
+    return best
+
+
+def classify(messages):
+    """
+    Label each message with its intent (complaint, question or chitchat), a
+    confidence, and the keyword-detected ticket category and priority.
+    Messages not seen recently are embedded together in one encode call.
+    """
+    labels, centroids = _model()
+    keys = [" ".join(message.lower().split()) for message in messages]
+    results = {key: label_cache.get(key) for key in set(keys)}
+    pending = [key for key, result in results.items() if result is None]
+
+    if pending:
+        similarity = _normalise(embedding.encode(pending)) @ centroids.T
+        for key, scores in zip(pending, similarity):
+            ranked = np.argsort(scores)[::-1]
+            # Margin over the runner-up label: near 0 means the message is ambiguous.
+            margin = scores[ranked[0]] - scores[ranked[1]] if len(ranked) > 1 else scores[ranked[0]]
+            category = match_keyword(key, CATEGORY_KEYWORDS)
+            result = {
+                "intent": labels[ranked[0]],
+                "confidence": round(float(margin), 4),
+                "category": None if category in NON_TICKET_CATEGORIES else category,
+                "priority": match_keyword(key, PRIORITY_KEYWORDS),
+            }
+            label_cache.set(key, result)
+            results[key] = result
+
+    return [dict(results[key], message=message) for key, message in zip(keys, messages)]
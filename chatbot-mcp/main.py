@@ -1,42 +1,176 @@
 from fastmcp import FastMCP
-from sqlalchemy import create_engine, text
+from fastmcp.server.dependencies import get_context
+from sqlalchemy import bindparam, text
+from starlette.responses import PlainTextResponse
 import os
+import sys
+import atexit
+import argparse
+import shutil
+import tempfile
 from dotenv import load_dotenv
-import chromadb
-from sentence_transformers import SentenceTransformer
 from datetime import datetime
-from sys_prompt import system_prompt
+from collections import Counter
+import re
+from sys_prompt import PromptCache
 
 load_dotenv()
 
-sql = create_engine(
-    f"mysql+pymysql://{os.getenv('DB_USER')}:@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-)
+import chat_history
+import database
+import embedding
+import faq
+import intent
+import metrics
+import migrations
+import encoding
+import pagination
+import query_guard
+import ticket_summary
+import vector_store
+from cache import TTLCache
+
+# uvicorn workers re-run this script as __mp_main__ and then import "main" for
+# the app factory; alias it so the module (and its engines) load once per worker.
+if __name__ in ("__main__", "__mp_main__"):
+    sys.modules.setdefault("main", sys.modules[__name__])
 
 mcp = FastMCP("sql-mcp")
-db = chromadb.PersistentClient(path="./faq_db")
-collection = db.get_or_create_collection(name="faq_docs")
+
+VALID_CATEGORIES = {"technical support", "billing", "account management", "retention & experience"}
+VALID_PRIORITIES = ("low", "medium", "high")
+VALID_STATUSES = ("open", "in_progress", "resolved")
+
+# Rows per multi-row INSERT in the bulk tools, and a cap on the escaped statement
+# size, in bytes, kept under PyMySQL's max_stmt_length (1024000) so executemany
+# never splits a chunk into several statements.
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "500"))
+BULK_CHUNK_BYTES = 512 * 1024
+
+
+# Sorted so the rendered prompt, and its version hash, is the same in every process.
+prompt_cache = PromptCache(
+    enums={("tickets", "category"): sorted(VALID_CATEGORIES), ("tickets", "priority"): list(VALID_PRIORITIES)},
+    check_interval=float(os.getenv("PROMPT_SCHEMA_CHECK_SECONDS", "300")),
+)
 
 
 @mcp.prompt()
-def sys_prompt():
-    return system_prompt()
+async def sys_prompt():
+    if prompt_cache.stale():
+        try:
+            await database.run(prompt_cache.refresh)
+        except Exception:
+            # Keep serving the last prompt (or the static schema) and retry after check_interval.
+            prompt_cache.mark_checked()
+    return prompt_cache.prompt
+
+
+def _describe_intent(result):
+    permission = "allowed" if result["intent"] == "complaint" else "forbidden"
+    line = (
+        f"Message {result['message']} is {result['intent']} (confidence={result['confidence']:.2f}), "
+        f"{permission} to run tool create_ticket"
+    )
+    if result["category"]:
+        line += f", category={result['category']}"
+    if result["priority"]:
+        line += f", priority={result['priority']}"
+    return line
 
 
 @mcp.tool()
+@metrics.instrument
 def chat_cat(message: str) -> str:
     """
     Categorize the user message, is it complaint, chitchat, or question.
+    Also suggests the ticket category and priority from the message keywords.
     """
-    chat_category = {"complaint", "chitchat", "question"}
-    if message != next(iter(chat_category.values())):
-        return f"Message {message} is not complaint, forbidden to run tool create_ticket"
-    else:
-        return f"Message {message} is complaint, allowed to run tool create_ticket"
-    
+    try:
+        result = intent.classify([message])[0]
+    except Exception as e:
+        return _error(f"Failed to classify message: {str(e)}")
+
+    if encoding.structured():
+        return encoding.dumps(result)
+    return _describe_intent(result)
+
 
 @mcp.tool()
-def create_ticket(
+@metrics.instrument
+def chat_cat_batch(messages: list[str]) -> str:
+    """
+    Categorize many user messages in one call, one result line per message.
+    """
+    try:
+        results = intent.classify(messages)
+    except Exception as e:
+        return _error(f"Failed to classify messages: {str(e)}")
+
+    if encoding.structured():
+        return encoding.dumps({"results": results})
+    return "\n".join(_describe_intent(result) for result in results)
+
+
+def _session_id():
+    try:
+        return get_context().session_id
+    except RuntimeError:
+        # Called outside an MCP request, e.g. directly from a script.
+        return None
+
+
+def _error(message):
+    metrics.mark_error()
+    if encoding.structured():
+        return encoding.dumps({"error": message})
+    return message
+
+
+def _ticket_error(category, priority):
+    if category not in VALID_CATEGORIES:
+        return f"Invalid category '{category}'. Must be one of: {', '.join(VALID_CATEGORIES)}"
+    if priority not in VALID_PRIORITIES:
+        return f"Invalid priority '{priority}'. Must be one of: {', '.join(VALID_PRIORITIES)}"
+    return None
+
+
+def _create_ticket(conn, user_id, title, description, category, priority):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # INSERT ... SELECT only inserts when the user exists, so the existence
+    # check and the insert are one atomic statement instead of two round trips.
+    add_ticket = text("""
+    INSERT INTO tickets (user_id, title, description, category, status, priority, created_at, updated_at)
+    SELECT id, :title, :description, :category, 'open', :priority, :now, :now
+    FROM users WHERE id = :user_id
+    """)
+    add_log = text("""
+    INSERT INTO ticket_logs (ticket_id, action, old_value, new_value, created_at)
+    VALUES (:ticket_id, 'created', NULL, 'open', :now)
+    """)
+    with conn.begin():
+        result = conn.execute(
+            add_ticket,
+            {
+                "user_id": user_id,
+                "title": title,
+                "description": description,
+                "category": category,
+                "priority": priority,
+                "now": now,
+            },
+        )
+        if result.rowcount == 0:
+            return None
+        ticket_id = result.lastrowid
+        conn.execute(add_log, {"ticket_id": ticket_id, "now": now})
+        ticket_summary.adjust(conn, {("open", category, priority): 1})
+    return ticket_id
+
+
+@mcp.tool()
+@metrics.instrument
+async def create_ticket(
     user_id: int,
     title: str,
     description: str,
@@ -50,164 +184,879 @@ def create_ticket(
     priority must be one of: low, medium, high.
     status is automatically set to 'open'.
     """
+    error = _ticket_error(category, priority)
+    if error:
+        return _error(error)
+
+    try:
+        ticket_id = await database.run(_create_ticket, user_id, title, description, category, priority)
+    except Exception as e:
+        return _error(f"Failed to create ticket: {str(e)}")
+    latest_tickets.pop(user_id)
+    database.pin(_session_id(), ("user", user_id))
+
+    if ticket_id is None:
+        return _error(
+            f"ERROR: user_id {user_id} does not exist. "
+            "Call find_user() first, then create_user() if user is new, "
+            "and use the ID returned from those tools."
+        )
+    if encoding.structured():
+        return encoding.dumps({"ticket_id": ticket_id, "status": "open", "priority": priority})
+    return f"Ticket created successfully! Ticket ID: {ticket_id}, Status: open, Priority: {priority}"
+
+
+USER_COLUMNS = ("id", "name", "email", "phone_number", "address")
+
+# find_user results keyed separately by email and by phone number. Only found
+# users are cached; any write to the users table clears both.
+users_by_email = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+)
+users_by_phone = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+)
+
+
+USERS_TABLE = re.compile(r"\busers\b", re.IGNORECASE)
+
+
+def _invalidate_users():
+    users_by_email.clear()
+    users_by_phone.clear()
+
+
+async def _lookup_user(email, phone_number):
+    # An email match wins over a phone match, so the phone cache can only
+    # answer lookups that have no email.
+    if email:
+        user = users_by_email.get(email)
+    else:
+        user = users_by_phone.get(phone_number) if phone_number else None
+    if user is not None:
+        return user
+
+    sticky = (_session_id(), email and ("email", email), phone_number and ("phone", phone_number))
+    user = await database.run(_find_user, email, phone_number, read_only=True, sticky=sticky)
+    if user is None:
+        return None
+    if user[2]:
+        users_by_email.set(user[2], user)
+    if user[3]:
+        users_by_phone.set(user[3], user)
+    return user
 
-    valid_categories = {"technical support", "billing", "account management", "retention & experience"}
-    valid_priorities = {"low", "medium", "high"}
 
-    if category not in valid_categories:
-        return f"Invalid category '{category}'. Must be one of: {', '.join(valid_categories)}"
-    if priority not in valid_priorities:
-        return f"Invalid priority '{priority}'. Must be one of: {', '.join(valid_priorities)}"
+# One index seek per non-empty key instead of "email = ? OR phone_number = ?",
+# which MySQL can only serve with an index merge or a full scan. When both keys
+# are given the seeks are combined with UNION ALL and an email match wins.
+_USER_BY_EMAIL = "SELECT 0 AS match_rank, id, name, email, phone_number, address FROM users WHERE email = :email"
+_USER_BY_PHONE = (
+    "SELECT 1 AS match_rank, id, name, email, phone_number, address FROM users WHERE phone_number = :phone_number"
+)
+FIND_USER_QUERIES = {
+    (True, False): text(f"{_USER_BY_EMAIL} LIMIT 1"),
+    (False, True): text(f"{_USER_BY_PHONE} LIMIT 1"),
+    (True, True): text(
+        f"SELECT * FROM ({_USER_BY_EMAIL} LIMIT 1) AS by_email "
+        f"UNION ALL SELECT * FROM ({_USER_BY_PHONE} LIMIT 1) AS by_phone "
+        "ORDER BY match_rank LIMIT 1"
+    ),
+}
+
 
+def _find_user(conn, email, phone_number):
+    query = FIND_USER_QUERIES.get((bool(email), bool(phone_number)))
+    if query is None:
+        return None
+    row = conn.execute(query, {"email": email, "phone_number": phone_number}).first()
+    metrics.add_rows(row is not None)
+    return tuple(row[1:]) if row else None
+
+
+@mcp.tool()
+@metrics.instrument
+async def find_user(email: str, phone_number: str) -> str:
+    """
+    Find user by email or phone number.
+    """
     try:
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with sql.connect() as conn:
-            search_user = conn.execute(
-                text("SELECT id FROM users WHERE id = :user_id"), {"user_id": user_id}
+        user = await _lookup_user(email, phone_number)
+        if encoding.structured():
+            found = encoding.record(USER_COLUMNS, user) if user else None
+            return encoding.dumps({"found": bool(user), "user": found})
+        if user:
+            # Akses pakai index integer, bukan string key
+            return f"User found: ID={user[0]}, name={user[1]}, email={user[2]}"
+        else:
+            return (
+                f"User with email {email} or phone number {phone_number} not found"
             )
-            result = search_user.fetchone()
-            if result is None:
-                return (
-                    f"ERROR: user_id {user_id} does not exist. "
-                    "Call find_user() first, then create_user() if user is new, "
-                    "and use the ID returned from those tools."
-                )
-            else:
-                add_ticket = text("""
-                INSERT INTO tickets (user_id, title, description, category, status, priority, created_at, updated_at)
-                VALUES (:user_id, :title, :description, :category, 'open', :priority, :now, :now)
-                """)
-                result = conn.execute(
-                    add_ticket,
-                    {
-                        "user_id": user_id,
-                        "title": title,
-                        "description": description,
-                        "category": category,
-                        "priority": priority,
-                        "now": now,
-                    },
-                )
-                conn.commit()
-                return f"Ticket created successfully! Ticket ID: {result.lastrowid}, Status: open, Priority: {priority}"
     except Exception as e:
-        return f"Failed to create ticket: {str(e)}"
+        return _error(f"Failed to find user: {str(e)}")
+
+
+TICKET_COLUMNS = ("id", "title", "category", "status", "priority", "created_at")
+LATEST_TICKET_QUERY = text("""
+    SELECT id, title, category, status, priority, created_at
+    FROM tickets WHERE user_id = :user_id
+    ORDER BY created_at DESC LIMIT 1
+""")
+TICKETS_TABLE = re.compile(r"\btickets\b", re.IGNORECASE)
+
+# Short-lived cache of each user's latest ticket (False when they have none).
+# LATEST_TICKET_CACHE_TTL=0 disables it.
+latest_tickets = TTLCache(
+    maxsize=int(os.getenv("LATEST_TICKET_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("LATEST_TICKET_CACHE_TTL", "30")),
+)
+
+
+def _latest_ticket(conn, user_id):
+    row = conn.execute(LATEST_TICKET_QUERY, {"user_id": user_id}).first()
+    metrics.add_rows(row is not None)
+    return tuple(row) if row else False
 
 
 @mcp.tool()
-def find_user(email: str, phone_number: str) -> str:
+@metrics.instrument
+async def get_latest_ticket(user_id: int) -> str:
     """
-    Find user by email or phone number.
+    Get the most recent ticket of a user.
+    user_id MUST come from find_user() or create_user().
     """
-    query = text("""
-        SELECT id, name, email, phone_number, address FROM users WHERE email = :email OR phone_number = :phone_number
-    """)
+    ticket = latest_tickets.get(user_id) if latest_tickets.ttl > 0 else None
+    if ticket is None:
+        try:
+            ticket = await database.run(
+                _latest_ticket, user_id, read_only=True, sticky=(_session_id(), ("user", user_id))
+            )
+        except Exception as e:
+            return _error(f"Failed to get latest ticket: {str(e)}")
+        if latest_tickets.ttl > 0:
+            latest_tickets.set(user_id, ticket)
+
+    if encoding.structured():
+        return encoding.dumps({"ticket": encoding.record(TICKET_COLUMNS, ticket) if ticket else None})
+    if not ticket:
+        return f"User {user_id} has no tickets"
+    return (
+        f"Latest ticket: ID={ticket[0]}, title={ticket[1]}, category={ticket[2]}, "
+        f"status={ticket[3]}, priority={ticket[4]}, created_at={ticket[5]}"
+    )
+
+
+def _update_ticket_status(conn, ticket_id, status):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Lock the row on MySQL so two updates can't both move the counter away from the same old status.
+    lock = " FOR UPDATE" if conn.dialect.name == "mysql" else ""
+    with conn.begin():
+        ticket = conn.execute(
+            text(f"SELECT user_id, status, category, priority FROM tickets WHERE id = :ticket_id{lock}"),
+            {"ticket_id": ticket_id},
+        ).first()
+        if ticket is None or ticket.status == status:
+            return ticket
+        conn.execute(
+            text("UPDATE tickets SET status = :status, updated_at = :now WHERE id = :ticket_id"),
+            {"status": status, "now": now, "ticket_id": ticket_id},
+        )
+        conn.execute(
+            text("""
+            INSERT INTO ticket_logs (ticket_id, action, old_value, new_value, created_at)
+            VALUES (:ticket_id, :action, :old_value, :new_value, :now)
+            """),
+            {
+                "ticket_id": ticket_id,
+                "action": "resolved" if status == "resolved" else "updated",
+                "old_value": ticket.status,
+                "new_value": status,
+                "now": now,
+            },
+        )
+        ticket_summary.adjust(
+            conn,
+            {(ticket.status, ticket.category, ticket.priority): -1, (status, ticket.category, ticket.priority): 1},
+        )
+    return ticket
+
+
+@mcp.tool()
+@metrics.instrument
+async def update_ticket_status(ticket_id: int, status: str) -> str:
+    """
+    Change a ticket's status (open, in_progress or resolved) and log the change in ticket_logs.
+    Use this instead of execute_query for status changes.
+    """
+    if status not in VALID_STATUSES:
+        return _error(f"Invalid status '{status}'. Must be one of: {', '.join(VALID_STATUSES)}")
 
     try:
-        with sql.connect() as conn:
-            result = conn.execute(query, {"email": email, "phone_number": phone_number})
-            user = result.fetchall()
-            if user:
-                # Akses pakai index integer, bukan string key
-                return f"User found: ID={user[0][0]}, name={user[0][1]}, email={user[0][2]}"
-            else:
-                return (
-                    f"User with email {email} or phone number {phone_number} not found"
-                )
+        ticket = await database.run(_update_ticket_status, ticket_id, status)
+    except Exception as e:
+        return _error(f"Failed to update ticket: {str(e)}")
+    if ticket is None:
+        return _error(f"Ticket {ticket_id} does not exist")
+
+    latest_tickets.pop(ticket.user_id)
+    database.pin(_session_id(), ("user", ticket.user_id))
+    if encoding.structured():
+        return encoding.dumps({"ticket_id": ticket_id, "old_status": ticket.status, "status": status})
+    if ticket.status == status:
+        return f"Ticket {ticket_id} is already {status}"
+    return f"Ticket {ticket_id} status changed from {ticket.status} to {status}"
+
+
+@mcp.tool()
+@metrics.instrument
+async def ticket_stats(status: str = "", category: str = "", priority: str = "") -> str:
+    """
+    Count tickets by status, category and priority, e.g. open high-priority billing tickets.
+    Every filter is optional; use this instead of COUNT(*) queries on tickets.
+    """
+    if status and status not in VALID_STATUSES:
+        return _error(f"Invalid status '{status}'. Must be one of: {', '.join(VALID_STATUSES)}")
+    if category and category not in VALID_CATEGORIES:
+        return _error(f"Invalid category '{category}'. Must be one of: {', '.join(sorted(VALID_CATEGORIES))}")
+    if priority and priority not in VALID_PRIORITIES:
+        return _error(f"Invalid priority '{priority}'. Must be one of: {', '.join(VALID_PRIORITIES)}")
+
+    try:
+        groups = await database.run(ticket_summary.summary, status, category, priority, read_only=True)
     except Exception as e:
-        return f"Failed to find user: {str(e)}"
+        return _error(f"Failed to read ticket stats: {str(e)}")
+
+    total = sum(group[3] for group in groups)
+    if encoding.structured():
+        return encoding.rows(("status", "category", "priority", "total"), groups, total=total)
+    lines = [f"Total: {total}"]
+    lines += [f"{s} / {c} / {p}: {n}" for s, c, p, n in groups]
+    return "\n".join(lines)
+
+
+def _create_user(conn, name, email, phone_number, address):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    add_user = text("""
+    INSERT INTO users (name, email, phone_number, address, created_at, updated_at)
+    VALUES (:name, :email, :phone_number, :address, :now, :now)
+    """)
+    result = conn.execute(
+        add_user,
+        {
+            "name": name,
+            "email": email,
+            "phone_number": phone_number,
+            "address": address,
+            "now": now,
+        },
+    )
+    conn.commit()
+    return result.lastrowid
 
 
 @mcp.tool()
-def create_user(name: str, email: str, phone_number: str, address: str) -> str:
+@metrics.instrument
+async def create_user(name: str, email: str, phone_number: str, address: str) -> str:
     """
     Create a new user with the provided information.
     """
+    try:
+        user_id = await database.run(_create_user, name, email, phone_number, address)
+        _invalidate_users()
+        database.pin(_session_id(), ("email", email), ("phone", phone_number))
+        if encoding.structured():
+            return encoding.dumps({"user_id": user_id})
+        return f"User created successfully! User ID: {user_id}"
+    except Exception as e:
+        return _error(f"Failed to find or create user: {str(e)}")
+
+
+def _row_bytes(row):
+    """
+    Upper bound on the bytes row adds to a multi-row INSERT: every character
+    may be escaped to two, plus quotes and ", " around each value and "(...)".
+    """
+    return sum(2 * len(str(value).encode("utf-8")) + 4 for value in row.values()) + 4
+
+
+def _chunks(rows):
+    chunk, size = [], 0
+    for row in rows:
+        row_size = _row_bytes(row)
+        if chunk and (len(chunk) >= BULK_CHUNK_ROWS or size + row_size > BULK_CHUNK_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(row)
+        size += row_size
+    if chunk:
+        yield chunk
+
+
+def _insert_many(conn, statement, rows):
+    """
+    executemany rows in chunks and return their auto-increment ids in order.
+    Each chunk is one multi-row INSERT, which gets consecutive ids: MySQL reports
+    the first one via LAST_INSERT_ID(), SQLite the last one via last_insert_rowid().
+    """
+    ids = []
+    for chunk in _chunks(rows):
+        result = conn.execute(statement, chunk)
+        if result.rowcount != len(chunk):
+            raise RuntimeError(f"Bulk insert wrote {result.rowcount} of {len(chunk)} rows")
+        if conn.dialect.name == "sqlite":
+            first_id = conn.execute(text("SELECT last_insert_rowid()")).scalar() - len(chunk) + 1
+        else:
+            first_id = conn.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+        ids.extend(range(first_id, first_id + len(chunk)))
+    return ids
+
+
+def _existing(conn, query, values):
+    """
+    Return the subset of values matched by query, which selects one column
+    WHERE col IN :values.
+    """
+    statement = text(query).bindparams(bindparam("values", expanding=True))
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), BULK_CHUNK_ROWS):
+        found.update(conn.execute(statement, {"values": values[start:start + BULK_CHUNK_ROWS]}).scalars())
+    return found
+
+
+def _bulk_report(kind, results):
+    created = sum(1 for ok, _ in results if ok)
+    if encoding.structured():
+        return encoding.dumps(
+            {
+                "created": created,
+                "results": [{"id": value} if ok else {"error": value} for ok, value in results],
+            }
+        )
+    lines = [f"Created {created} of {len(results)} {kind}."]
+    for i, (ok, value) in enumerate(results):
+        lines.append(f"Row {i}: ID={value}" if ok else f"Row {i}: ERROR {value}")
+    return "\n".join(lines)
+
+
+def _create_tickets_bulk(conn, rows, results):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    add_ticket = text("""
+    INSERT INTO tickets (user_id, title, description, category, status, priority, created_at, updated_at)
+    VALUES (:user_id, :title, :description, :category, 'open', :priority, :now, :now)
+    """)
+    add_log = text("""
+    INSERT INTO ticket_logs (ticket_id, action, old_value, new_value, created_at)
+    VALUES (:ticket_id, 'created', NULL, 'open', :now)
+    """)
+    with conn.begin():
+        known_users = _existing(
+            conn, "SELECT id FROM users WHERE id IN :values", {row["user_id"] for _, row in rows}
+        )
+        valid = []
+        for index, row in rows:
+            if row["user_id"] in known_users:
+                valid.append((index, dict(row, now=now)))
+            else:
+                results[index] = (False, f"user_id {row['user_id']} does not exist")
+        if not valid:
+            return results
+
+        ticket_ids = _insert_many(conn, add_ticket, [row for _, row in valid])
+        conn.execute(add_log, [{"ticket_id": ticket_id, "now": now} for ticket_id in ticket_ids])
+        ticket_summary.adjust(conn, Counter(("open", row["category"], row["priority"]) for _, row in valid))
+    for (index, _), ticket_id in zip(valid, ticket_ids):
+        results[index] = (True, ticket_id)
+    return results
+
+
+@mcp.tool()
+@metrics.instrument
+async def create_tickets_bulk(tickets: list[dict]) -> str:
+    """
+    Create many support tickets in one transaction.
+    Each item needs user_id, title, description, category and priority, with the
+    same rules as create_ticket. Returns the ticket ID or error of every row, in input order.
+    """
+    results = [None] * len(tickets)
+    rows = []
+    for index, ticket in enumerate(tickets):
+        missing = [key for key in ("user_id", "title", "description", "category", "priority") if key not in ticket]
+        if missing:
+            results[index] = (False, f"missing fields: {', '.join(missing)}")
+            continue
+        error = _ticket_error(ticket["category"], ticket["priority"])
+        if error:
+            results[index] = (False, error)
+            continue
+        try:
+            user_id = int(ticket["user_id"])
+        except (TypeError, ValueError):
+            results[index] = (False, f"user_id {ticket['user_id']!r} is not an integer")
+            continue
+        rows.append(
+            (
+                index,
+                {
+                    "user_id": user_id,
+                    "title": ticket["title"],
+                    "description": ticket["description"],
+                    "category": ticket["category"],
+                    "priority": ticket["priority"],
+                },
+            )
+        )
+
     try:
-        with sql.connect() as conn:
-            add_user = text("""
-            INSERT INTO users (name, email, phone_number, address, created_at, updated_at)
-            VALUES (:name, :email, :phone_number, :address, :now, :now)
-            """)
-            result = conn.execute(
-                add_user,
+        if rows:
+            results = await database.run(_create_tickets_bulk, rows, results)
+            for _, row in rows:
+                latest_tickets.pop(row["user_id"])
+            database.pin(_session_id(), *(("user", row["user_id"]) for _, row in rows))
+    except Exception as e:
+        return _error(f"Failed to create tickets: {str(e)}")
+    return _bulk_report("tickets", results)
+
+
+def _create_users_bulk(conn, rows, results):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    add_user = text("""
+    INSERT INTO users (name, email, phone_number, address, created_at, updated_at)
+    VALUES (:name, :email, :phone_number, :address, :now, :now)
+    """)
+    with conn.begin():
+        registered = _existing(conn, "SELECT email FROM users WHERE email IN :values", {row["email"] for _, row in rows})
+        registered_phones = _existing(
+            conn, "SELECT phone_number FROM users WHERE phone_number IN :values", {row["phone_number"] for _, row in rows}
+        )
+        valid = []
+        for index, row in rows:
+            if row["email"] in registered:
+                results[index] = (False, f"email {row['email']} is already registered")
+            elif row["phone_number"] in registered_phones:
+                results[index] = (False, f"phone number {row['phone_number']} is already registered")
+            else:
+                valid.append((index, dict(row, now=now)))
+        if not valid:
+            return results
+
+        user_ids = _insert_many(conn, add_user, [row for _, row in valid])
+    for (index, _), user_id in zip(valid, user_ids):
+        results[index] = (True, user_id)
+    return results
+
+
+@mcp.tool()
+@metrics.instrument
+async def create_users_bulk(users: list[dict]) -> str:
+    """
+    Create many users in one transaction.
+    Each item needs name, email, phone_number and address. Emails and phone numbers
+    that are already registered or repeated in the list are rejected. Returns the user ID or error
+    of every row, in input order.
+    """
+    results = [None] * len(users)
+    rows = []
+    seen_emails = set()
+    seen_phones = set()
+    for index, user in enumerate(users):
+        missing = [key for key in ("name", "email", "phone_number", "address") if not user.get(key)]
+        if missing:
+            results[index] = (False, f"missing fields: {', '.join(missing)}")
+            continue
+        if user["email"] in seen_emails:
+            results[index] = (False, f"email {user['email']} is repeated in the list")
+            continue
+        if user["phone_number"] in seen_phones:
+            results[index] = (False, f"phone number {user['phone_number']} is repeated in the list")
+            continue
+        seen_emails.add(user["email"])
+        seen_phones.add(user["phone_number"])
+        rows.append(
+            (
+                index,
                 {
-                    "name": name,
-                    "email": email,
-                    "phone_number": phone_number,
-                    "address": address,
-                    "now": now,
+                    "name": user["name"],
+                    "email": user["email"],
+                    "phone_number": user["phone_number"],
+                    "address": user["address"],
                 },
             )
-            conn.commit()
-            return f"User created successfully! User ID: {result.lastrowid}"
+        )
+
+    try:
+        if rows:
+            results = await database.run(_create_users_bulk, rows, results)
+            _invalidate_users()
+            created = [row for (index, row) in rows if results[index][0]]
+            database.pin(
+                _session_id(),
+                *(("email", row["email"]) for row in created),
+                *(("phone", row["phone_number"]) for row in created),
+            )
     except Exception as e:
-        return f"Failed to find or create user: {str(e)}"
+        return _error(f"Failed to create users: {str(e)}")
+    return _bulk_report("users", results)
+
+
+UNORDERED_PAGE_HINT = "Add an ORDER BY ending with a unique column such as id to page through them."
+
+
+def _execute_query(conn, query, statement, kind, page):
+    # Keyset pages start right after the previous row, so they don't scan the earlier ones.
+    statement = query_guard.check(conn, statement, kind, 0 if page["key"] is not None else page["offset"])
+    with query_guard.limits(conn, kind):
+        return _run_statement(conn, query, statement, kind, page)
+
+
+def _run_statement(conn, query, statement, kind, page):
+    if kind in query_guard.READ_KINDS:
+        columns, rows, next_page = pagination.fetch_page(conn, statement, page)
+        next_token = pagination.encode_token(query, next_page) if next_page and next_page["ordered"] else None
+        if encoding.structured():
+            extra = {"next_page_token": next_token}
+            if next_page and not next_page["ordered"]:
+                extra["more_rows"] = UNORDERED_PAGE_HINT
+            return encoding.rows(columns, rows, **extra)
+        if not rows:
+            return "No results"
+        output = str(rows)
+        if next_token is not None:
+            output += (
+                f"\nShowing rows {page['offset'] + 1}-{next_page['offset']}. More rows available: call execute_query "
+                f"again with the same query and page_token='{next_token}'"
+            )
+        elif next_page is not None:
+            output += f"\nShowing the first {len(rows)} rows. More rows available. {UNORDERED_PAGE_HINT}"
+        return output
+    else:
+        result = conn.execute(text(statement))
+        conn.commit()
+        if encoding.structured():
+            return encoding.dumps({"rows_affected": result.rowcount})
+        return f"Query executed successfully. Rows affected: {result.rowcount}"
 
 
 @mcp.tool()
-def execute_query(query: str) -> str:
+@metrics.instrument
+async def execute_query(query: str, page_token: str = "") -> str:
     """
     Execute a raw SQL query (SELECT, INSERT, UPDATE only). DELETE is forbidden.
     Use this only for complex or admin-level queries.
+    SELECT results are paginated; pass the returned page_token with the same
+    query to fetch the next page. Only queries with an ORDER BY (ending with a
+    unique column such as id) can be paged. Queries that would scan too many rows are rejected.
     """
-    query_upper = query.strip().upper()
+    try:
+        statement, kind = query_guard.parse(query)
+    except query_guard.QueryRejected as e:
+        return _error(str(e))
 
-    if query_upper.startswith("DELETE"):
-        return "Delete is not allowed"
+    is_select = kind in query_guard.READ_KINDS
+    try:
+        page = pagination.decode_token(query, page_token) if page_token else {"offset": 0, "key": None}
+    except pagination.InvalidPageToken as e:
+        return _error(str(e))
 
     try:
-        with sql.connect() as conn:
-            result = conn.execute(text(query))
+        if is_select:
+            return await database.run(
+                _execute_query, query, statement, kind, page, read_only=True, sticky=(_session_id(),)
+            )
+        return await database.run(_execute_query, query, statement, kind, page)
+    except Exception as e:
+        return _error(str(e))
+    finally:
+        if not is_select:
+            database.pin(_session_id())
+        if not is_select and USERS_TABLE.search(query):
+            _invalidate_users()
+        if not is_select and TICKETS_TABLE.search(query):
+            latest_tickets.clear()
 
-            if query_upper.startswith("SELECT"):
-                rows = result.fetchall()
-                if rows:
-                    return str(rows)
-                else:
-                    return "No results"
-            else:
-                conn.commit()
-                return f"Query executed successfully. Rows affected: {result.rowcount}"
 
-    except Exception as e:
-        return str(e)
+chat_writer = chat_history.ChatHistoryWriter(
+    database.sql,
+    batch_size=int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("CHAT_HISTORY_FLUSH_SECONDS", "1.0")),
+    max_queue=int(os.getenv("CHAT_HISTORY_MAX_QUEUE", "10000")),
+)
+atexit.register(chat_writer.close)
+
+stats_reconciler = ticket_summary.Reconciler(
+    database.sql, interval=float(os.getenv("TICKET_STATS_RECONCILE_SECONDS", "3600"))
+)
+atexit.register(stats_reconciler.close)
+
+
+@mcp.tool()
+@metrics.instrument
+def log_chat_message(user_id: int, session_id: str, role: str, message: str) -> str:
+    """
+    Record one chat message in chat_history.
+    role must be one of: user, assistant.
+    The message is queued and written in the background, so this returns immediately.
+    """
+    if role not in {"user", "assistant"}:
+        return _error(f"Invalid role '{role}'. Must be one of: user, assistant")
+
+    if not chat_writer.log(user_id, session_id, role, message):
+        return _error("Chat history is busy, message was not recorded")
+    if encoding.structured():
+        return encoding.dumps({"queued": True})
+    return "Message queued for chat history"
+
+
+@mcp.tool()
+@metrics.instrument
+def chat_history_stats() -> str:
+    """
+    Show how many chat messages were queued, written, dropped or failed.
+    """
+    stats = chat_writer.stats()
+    avg_batch = stats["written"] / stats["batches"] if stats["batches"] else 0.0
+    return (
+        f"Queued: {stats['queued']}, written: {stats['written']}, pending: {stats['pending']}, "
+        f"dropped: {stats['dropped']}, failed: {stats['failed']}, batches: {stats['batches']}, "
+        f"avg batch: {avg_batch:.1f}, write time: {stats['write_seconds']:.2f}s"
+    )
 
 
 @mcp.tool()
+@metrics.instrument
 def save_faq_docs() -> str:
     """
-    Query from database to get faq docs and save to local vector database
+    Sync faq docs from the database to the local vector database.
+    Only new or changed questions are embedded; deleted ones are removed.
+    """
+    try:
+        with database.connect(database.read_engine()) as conn:
+            report = faq.sync(
+                conn, vector_store.collection(), max_batch_size=vector_store.client().get_max_batch_size()
+            )
+    except Exception as e:
+        return _error(f"Failed to sync FAQ data: {str(e)}")
+
+    if report["total"] == 0 and report["removed"] == 0:
+        return _error("No FAQ data found in the database.")
+
+    if encoding.structured():
+        return encoding.dumps(
+            dict(report, encode_seconds=round(report["encode_seconds"], 3), seconds=round(report["seconds"], 3))
+        )
+    return (
+        f"FAQ docs synced to vector database. Total documents: {report['total']}, "
+        f"added: {report['added']}, updated: {report['updated']}, "
+        f"removed: {report['removed']}, skipped: {report['skipped']}, "
+        f"batches: {report['batches']}, encode time: {report['encode_seconds']:.2f}s, "
+        f"total time: {report['seconds']:.2f}s"
+    )
+
+
+@mcp.tool()
+@metrics.instrument
+def search_faq(question: str, top_k: int = 3) -> str:
+    """
+    Search the FAQ knowledge base for answers to the user's question.
+    Combines keyword (BM25) and vector search; vector hits show their distance (lower is closer).
     """
-    data = []
+    if top_k < 1:
+        return _error("top_k must be at least 1")
 
     try:
-        with sql.connect() as conn:
-            result = conn.execute(text("SELECT question, answer FROM faq_docs"))
-            rows = result.fetchall()
+        results = faq.search(vector_store.collection(), question, top_k)
     except Exception as e:
-        return f"Failed to fetch FAQ data: {str(e)}"
+        return _error(f"Failed to search FAQ: {str(e)}")
 
-    if not rows:
-        return "No FAQ data found in the database."
+    if encoding.structured():
+        return encoding.dumps(
+            {
+                "results": [
+                    dict(r, distance=None if r["distance"] is None else round(r["distance"], 4), score=round(r["score"], 4))
+                    for r in results
+                ]
+            }
+        )
+    if not results:
+        return "No FAQ entries found. Run save_faq_docs first."
 
-    for row in rows:
-        data.append({"question": row[0], "answer": row[1]})
+    return "\n".join(
+        f"{i}. Q: {r['question']} | A: {r['answer']} "
+        + ("(keyword match)" if r["distance"] is None else f"(distance={r['distance']:.4f})")
+        for i, r in enumerate(results, start=1)
+    )
+
+
+@mcp.tool()
+@metrics.instrument
+def cache_stats() -> str:
+    """
+    Show hit and miss counters of the in-process caches.
+    """
+    caches = {
+        "users_by_email": users_by_email,
+        "users_by_phone": users_by_phone,
+        "latest_tickets": latest_tickets,
+        "faq_embeddings": faq.embedding_cache,
+        "faq_results": faq.result_cache,
+        "faq_semantic": faq.semantic_cache,
+        "intent_labels": intent.label_cache,
+    }
+    lines = []
+    for name, cache in caches.items():
+        stats = cache.stats()
+        lines.append(
+            f"{name}: size={stats['size']}, hits={stats['hits']}, "
+            f"misses={stats['misses']}, hit_rate={stats['hit_rate']:.2%}"
+        )
+    return "\n".join(lines)
+
+
+@mcp.tool()
+@metrics.instrument
+def prompt_version() -> str:
+    """
+    Show the version hash of the system prompt and where its schema section came from.
+    """
+    built = datetime.fromtimestamp(prompt_cache.built_at).strftime("%Y-%m-%d %H:%M:%S")
+    if encoding.structured():
+        return encoding.dumps({"version": prompt_cache.version, "schema_source": prompt_cache.source, "built_at": built})
+    return f"Prompt version: {prompt_cache.version}, schema from: {prompt_cache.source}, built at: {built}"
 
-    vector = SentenceTransformer("all-MiniLM-L6-v2")
-    questions = [doc["question"] for doc in data]
-    embed_data = vector.encode(questions)
 
-    collection.upsert(
-        documents=questions,
-        metadatas=[{"answer": doc["answer"]} for doc in data],
-        ids=[str(i) for i in range(len(data))],
-        embeddings=embed_data.tolist(),
+@mcp.tool()
+@metrics.instrument
+def pool_status() -> str:
+    """
+    Show database connection pool usage and checkout wait times.
+    """
+    stats = database.pool_status()
+    output = (
+        f"Pool size: {stats['size']}, checked out: {stats['checked_out']}, "
+        f"idle: {stats['idle']}, overflow: {stats['overflow']}, "
+        f"checkouts: {stats['checkouts']}, timeouts: {stats['timeouts']}, "
+        f"avg wait: {stats['avg_wait_seconds'] * 1000:.1f}ms, "
+        f"max wait: {stats['max_wait_seconds'] * 1000:.1f}ms"
+    )
+    if database.replica_sql is not None:
+        replica = database.pool_status(database.async_replica_sql or database.replica_sql)
+        output += (
+            f"\nReplica pool size: {replica['size']}, checked out: {replica['checked_out']}, "
+            f"idle: {replica['idle']}, overflow: {replica['overflow']}, "
+            f"fallbacks to primary: {replica['replica_fallbacks']}"
+        )
+    return output
+
+
+@mcp.tool()
+@metrics.instrument
+def embedding_stats() -> str:
+    """
+    Show embedding model load time and encode throughput.
+    """
+    stats = embedding.stats()
+    if stats["load_seconds"] is None:
+        return "Embedding model is not loaded yet"
+    return (
+        f"Model: {stats['model']} ({stats['backend']}), load time: {stats['load_seconds']:.2f}s, "
+        f"encode calls: {stats['encode_calls']}, texts encoded: {stats['encoded_texts']}, "
+        f"throughput: {stats['texts_per_second']:.1f} texts/s"
+        + (
+            f", min cosine vs reference: {stats['min_cosine_vs_reference']:.4f}"
+            if stats["min_cosine_vs_reference"] is not None
+            else ""
+        )
     )
 
-    return f"FAQ docs saved to vector database. Total documents: {len(data)}"
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request):
+    """
+    Per-tool call counts, errors, latency histograms and DB / embedding / Chroma time.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _prepare_worker():
+    try:
+        with database.connect() as conn:
+            prompt_cache.refresh(conn)
+    except Exception as e:
+        prompt_cache.mark_checked()
+        print(f"prompt: schema reflection failed ({e}), using the static schema")
+    print(f"prompt: version {prompt_cache.version} (schema from {prompt_cache.source})")
+    try:
+        vector_store.collection()
+    except Exception as e:
+        print(f"chroma: not reachable yet ({e}), retrying on first FAQ call")
+    if os.getenv("EMBEDDING_WARMUP", "false").lower() == "true":
+        embedding.warm_up()
+        # Build the intent centroids now too, instead of on the first chat_cat call.
+        intent.train()
+
+
+def http_app():
+    """
+    App factory run by each uvicorn worker after it starts. Sessions are
+    stateless because consecutive requests of one client can reach
+    different workers.
+    """
+    _prepare_worker()
+    if os.getenv("MCP_METRICS_DIR"):
+        metrics.share(os.environ["MCP_METRICS_DIR"])
+    return mcp.http_app(stateless_http=True)
 
 
 if __name__ == "__main__":
-    mcp.run(transport="streamable-http", port=5000)
+    parser = argparse.ArgumentParser(description="BFiber SQL MCP server")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("MCP_WORKERS", "1")),
+        help="worker processes serving streamable-http; above 1 the FAQ vectors are served by a Chroma server",
+    )
+    args = parser.parse_args()
+    port = int(os.getenv("MCP_PORT", "5000"))
+
+    if database.env_bool("DB_BOOTSTRAP_SCHEMA", True):
+        for line in migrations.bootstrap(database.sql):
+            print(f"schema: {line}")
+    # One reconciler for all workers, run by this process.
+    stats_reconciler.start()
+
+    if args.workers > 1:
+        import uvicorn
+
+        # A write only updates the caches of the worker that made it, so by
+        # default workers don't cache users or latest tickets. Replica pins are
+        # shared through DB_REPLICA_PINS_DIR and counters are summed across
+        # workers through MCP_METRICS_DIR.
+        os.environ.setdefault("USER_CACHE_TTL", "0")
+        os.environ.setdefault("LATEST_TICKET_CACHE_TTL", "0")
+        for name, prefix in (("DB_REPLICA_PINS_DIR", "mcp-pins-"), ("MCP_METRICS_DIR", "mcp-metrics-")):
+            if not os.getenv(name):
+                os.environ[name] = tempfile.mkdtemp(prefix=prefix)
+                atexit.register(shutil.rmtree, os.environ[name], True)
+
+        if not os.getenv("CHROMA_HOST"):
+            chroma_port = int(os.getenv("CHROMA_PORT", "8000"))
+            chroma_server = vector_store.serve(port=chroma_port)
+            atexit.register(chroma_server.terminate)
+            # Inherited by the workers, which connect to it instead of opening CHROMA_PATH.
+            os.environ["CHROMA_HOST"] = "127.0.0.1"
+            print(f"chroma: serving {vector_store.CHROMA_PATH} on port {chroma_port}")
+        # Workers import torch and chromadb (and warm up the model) before they
+        # answer uvicorn's health check, which takes longer than its 5s default.
+        uvicorn.run(
+            "main:http_app",
+            factory=True,
+            host="127.0.0.1",
+            port=port,
+            workers=args.workers,
+            timeout_worker_healthcheck=120,
+        )
+    else:
+        _prepare_worker()
+        mcp.run(transport="streamable-http", port=port)
@@ -0,0 +1,315 @@
+import functools
+import glob
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the tool latency histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_CALL_SECONDS = float(os.getenv("SLOW_CALL_SECONDS", "1.0"))
+# Statements kept per call for the slow-call log.
+MAX_LOGGED_STATEMENTS = 20
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+# Per-call accumulator of the tool currently running in this context.
+_current = ContextVar("mcp_tool_call", default=None)
+_lock = threading.Lock()
+_COUNTERS = ("calls", "errors", "seconds", "statements", "rows", "affected")
+
+
+def _empty_tool():
+    return {
+        "calls": 0,
+        "errors": 0,
+        "seconds": 0.0,
+        "buckets": [0] * len(BUCKETS),
+        "phases": defaultdict(float),
+        "statements": 0,
+        "rows": 0,
+        "affected": 0,
+    }
+
+
+_tools = defaultdict(_empty_tool)
+# Directory where each server process publishes its counters (see share()).
+_shared_dir = None
+
+
+def normalise_sql(statement):
+    """
+    Collapse whitespace and replace literals with ?, so slow calls with
+    different values log the same statement.
+    """
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def instrument(fn):
+    """
+    Record calls, errors, latency and the DB / embedding / Chroma time of a
+    sync or async tool function.
+    """
+    name = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            call, token = _begin()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                call["error"] = True
+                raise
+            finally:
+                _end(name, call, token)
+
+    else:
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call, token = _begin()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                call["error"] = True
+                raise
+            finally:
+                _end(name, call, token)
+
+    return wrapper
+
+
+def _begin():
+    call = {
+        "start": time.perf_counter(),
+        "error": False,
+        "phases": defaultdict(float),
+        "statements": [],
+        "statement_count": 0,
+        "rows": 0,
+        "affected": 0,
+    }
+    return call, _current.set(call)
+
+
+def _end(name, call, token):
+    _current.reset(token)
+    elapsed = time.perf_counter() - call["start"]
+    with _lock:
+        tool = _tools[name]
+        tool["calls"] += 1
+        tool["errors"] += call["error"]
+        tool["seconds"] += elapsed
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                tool["buckets"][i] += 1
+                break
+        for phase, seconds in call["phases"].items():
+            tool["phases"][phase] += seconds
+        tool["statements"] += call["statement_count"]
+        tool["rows"] += call["rows"]
+        tool["affected"] += call["affected"]
+
+    if elapsed >= SLOW_CALL_SECONDS:
+        phases = ", ".join(f"{phase}={seconds:.3f}s" for phase, seconds in sorted(call["phases"].items()))
+        statements = "".join(f"\n  {seconds:.3f}s {statement}" for statement, seconds in call["statements"])
+        logger.warning("slow tool call %s: %.3fs (%s)%s", name, elapsed, phases or "no phases", statements)
+
+
+def mark_error():
+    """
+    Count the running tool call as failed even though it returned normally.
+    """
+    call = _current.get()
+    if call is not None:
+        call["error"] = True
+
+
+def add_rows(count):
+    """
+    Count rows a tool fetched from the database; drivers don't report this for SELECTs.
+    """
+    call = _current.get()
+    if call is not None:
+        call["rows"] += count
+
+
+def record_phase(phase, seconds):
+    call = _current.get()
+    if call is not None:
+        call["phases"][phase] += seconds
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def instrument_engine(engine):
+    """
+    Attribute the statements run on engine, and their time and row counts, to
+    the tool call that issued them.
+    """
+
+    # The start time is kept on the execution context, which is discarded with
+    # the statement, so one that raises leaves nothing behind on the connection.
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        call = _current.get()
+        if call is None:
+            return
+        call["phases"]["db"] += elapsed
+        call["statement_count"] += 1
+        if cursor.description is None and cursor.rowcount > 0:
+            call["affected"] += cursor.rowcount
+        if len(call["statements"]) < MAX_LOGGED_STATEMENTS:
+            call["statements"].append((normalise_sql(statement), elapsed))
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: dict(tool, buckets=list(tool["buckets"]), phases=dict(tool["phases"]))
+            for name, tool in sorted(_tools.items())
+        }
+
+
+def _publish():
+    path = os.path.join(_shared_dir, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(_snapshot(), f)
+    os.replace(f"{path}.tmp", path)
+
+
+def share(directory, interval=5.0):
+    """
+    Publish this process's counters to directory every interval seconds, so
+    render() in any of the processes sharing it reports the sum of all of
+    them. Files of processes that exited are kept, because their calls still
+    count.
+    """
+    global _shared_dir
+    _shared_dir = directory
+    os.makedirs(directory, exist_ok=True)
+
+    def publish_forever():
+        while True:
+            time.sleep(interval)
+            try:
+                _publish()
+            except OSError as e:
+                logger.warning("could not publish metrics to %s: %s", directory, e)
+
+    threading.Thread(target=publish_forever, name="metrics-share", daemon=True).start()
+
+
+def _collect():
+    """
+    Counters of this process, or summed over every process publishing to the
+    shared directory (other processes are at most one publish interval old).
+    """
+    if _shared_dir is None:
+        return _snapshot()
+    _publish()
+    tools = defaultdict(_empty_tool)
+    for path in glob.glob(os.path.join(_shared_dir, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, tool in published.items():
+            total = tools[name]
+            for field in _COUNTERS:
+                total[field] += tool[field]
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], tool["buckets"])]
+            for phase_name, seconds in tool["phases"].items():
+                total["phases"][phase_name] += seconds
+    return dict(sorted(tools.items()))
+
+
+def render():
+    """
+    Return the collected metrics in the Prometheus text exposition format.
+    """
+    tools = _collect()
+
+    lines = [
+        "# HELP mcp_tool_calls_total Tool calls.",
+        "# TYPE mcp_tool_calls_total counter",
+    ]
+    lines += [f'mcp_tool_calls_total{{tool="{name}"}} {tool["calls"]}' for name, tool in tools.items()]
+    lines += [
+        "# HELP mcp_tool_errors_total Tool calls that raised or returned an error.",
+        "# TYPE mcp_tool_errors_total counter",
+    ]
+    lines += [f'mcp_tool_errors_total{{tool="{name}"}} {tool["errors"]}' for name, tool in tools.items()]
+
+    lines += [
+        "# HELP mcp_tool_duration_seconds Tool call latency.",
+        "# TYPE mcp_tool_duration_seconds histogram",
+    ]
+    for name, tool in tools.items():
+        cumulative = 0
+        for bound, count in zip(BUCKETS, tool["buckets"]):
+            cumulative += count
+            lines.append(f'mcp_tool_duration_seconds_bucket{{tool="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'mcp_tool_duration_seconds_bucket{{tool="{name}",le="+Inf"}} {tool["calls"]}')
+        lines.append(f'mcp_tool_duration_seconds_sum{{tool="{name}"}} {tool["seconds"]:.6f}')
+        lines.append(f'mcp_tool_duration_seconds_count{{tool="{name}"}} {tool["calls"]}')
+
+    lines += [
+        "# HELP mcp_tool_phase_seconds_total Time spent in db, embedding and chroma during tool calls.",
+        "# TYPE mcp_tool_phase_seconds_total counter",
+    ]
+    for name, tool in tools.items():
+        for phase_name, seconds in sorted(tool["phases"].items()):
+            lines.append(f'mcp_tool_phase_seconds_total{{tool="{name}",phase="{phase_name}"}} {seconds:.6f}')
+
+    lines += [
+        "# HELP mcp_tool_db_statements_total SQL statements executed by tool calls.",
+        "# TYPE mcp_tool_db_statements_total counter",
+    ]
+    lines += [f'mcp_tool_db_statements_total{{tool="{name}"}} {tool["statements"]}' for name, tool in tools.items()]
+    lines += [
+        "# HELP mcp_tool_db_rows_total Rows fetched from the database by tool calls.",
+        "# TYPE mcp_tool_db_rows_total counter",
+    ]
+    lines += [f'mcp_tool_db_rows_total{{tool="{name}"}} {tool["rows"]}' for name, tool in tools.items()]
+    lines += [
+        "# HELP mcp_tool_db_rows_affected_total Rows inserted or updated by tool calls.",
+        "# TYPE mcp_tool_db_rows_affected_total counter",
+    ]
+    lines += [
+        f'mcp_tool_db_rows_affected_total{{tool="{name}"}} {tool["affected"]}' for name, tool in tools.items()
+    ]
+    return "\n".join(lines) + "\n"
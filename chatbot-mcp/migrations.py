@@ -0,0 +1,94 @@
+"""
+Idempotent schema bootstrap: make sure the indexes and summary tables the
+tools rely on exist.
+
+Runs at server start unless DB_BOOTSTRAP_SCHEMA=false, or on demand with
+`python migrations.py`.
+"""
+
+from sqlalchemy import inspect, text
+
+import ticket_summary
+
+# (table, index name, columns, unique)
+INDEXES = [
+    ("users", "uq_users_email", ("email",), True),
+    ("users", "uq_users_phone_number", ("phone_number",), True),
+    # get_latest_ticket: seek on user_id and read the newest created_at backwards from the index.
+    ("tickets", "ix_tickets_user_created", ("user_id", "created_at"), False),
+]
+
+
+def _indexed_columns(inspector, table):
+    found = [tuple(index["column_names"]) for index in inspector.get_indexes(table)]
+    found += [tuple(constraint["column_names"]) for constraint in inspector.get_unique_constraints(table)]
+    return set(found)
+
+
+def ensure_indexes(engine):
+    """
+    Create every missing index in INDEXES and return one status line per index.
+
+    A unique index that cannot be built because the table already holds
+    duplicates falls back to a plain index, so lookups still get an index seek.
+    """
+    report = []
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        tables = set(inspector.get_table_names())
+        for table, name, columns, unique in INDEXES:
+            if table not in tables:
+                report.append(f"{name}: skipped, table {table} does not exist")
+                continue
+            if columns in _indexed_columns(inspector, table):
+                report.append(f"{name}: already present")
+                continue
+
+            column_list = ", ".join(columns)
+            try:
+                conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({column_list})"))
+                conn.commit()
+                report.append(f"{name}: created")
+            except Exception as e:
+                conn.rollback()
+                if not unique:
+                    report.append(f"{name}: failed ({e})")
+                    continue
+                fallback = name.replace("uq_", "ix_", 1)
+                try:
+                    conn.execute(text(f"CREATE INDEX {fallback} ON {table} ({column_list})"))
+                    conn.commit()
+                    report.append(f"{name}: could not be unique ({e}), created non-unique {fallback} instead")
+                except Exception as fallback_error:
+                    conn.rollback()
+                    report.append(f"{name}: failed ({fallback_error})")
+            inspector.clear_cache()
+    return report
+
+
+def ensure_ticket_stats(engine):
+    """
+    Create the ticket_stats summary table and fill it from tickets if it is missing.
+    """
+    with engine.connect() as conn:
+        inspector = inspect(conn)
+        if not inspector.has_table("tickets"):
+            return ["ticket_stats: skipped, table tickets does not exist"]
+        if inspector.has_table("ticket_stats"):
+            return ["ticket_stats: already present"]
+        ticket_summary.create(conn)
+        conn.commit()
+        ticket_summary.reconcile(conn)
+        groups = len(ticket_summary.summary(conn))
+    return [f"ticket_stats: created, {groups} status/category/priority groups counted"]
+
+
+def bootstrap(engine):
+    return ensure_indexes(engine) + ensure_ticket_stats(engine)
+
+
+if __name__ == "__main__":
+    import database
+
+    for line in bootstrap(database.sql):
+        print(line)
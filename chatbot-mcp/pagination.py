@@ -0,0 +1,259 @@
+import base64
+import hashlib
+import json
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import text
+
+import metrics
+
+MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "100"))
+MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", "32768"))
+FETCH_SIZE = int(os.getenv("QUERY_FETCH_SIZE", "50"))
+
+_TRAILING_LIMIT = re.compile(r"\blimit\s+\d+(\s*,\s*\d+|\s+offset\s+\d+)?\s*$", re.IGNORECASE)
+_TRAILING_LOCK = re.compile(
+    r"\b(for\s+(update|share)(\s+of\s+[\w`\".,\s]+?)?(\s+(nowait|skip\s+locked))?|lock\s+in\s+share\s+mode)\s*$",
+    re.IGNORECASE,
+)
+_ORDER_BY = re.compile(r"\border\s+by\b", re.IGNORECASE)
+_IDENTIFIER = r"(?:`[^`]+`|\"[^\"]+\"|\w+)"
+_ORDER_TERM = re.compile(rf"^((?:{_IDENTIFIER}\.)*)({_IDENTIFIER})(?:\s+(asc|desc))?$", re.IGNORECASE)
+_DATE_TYPES = {"datetime": datetime, "date": date}
+
+
+class InvalidPageToken(ValueError):
+    pass
+
+
+def _digest(query):
+    return hashlib.sha1(" ".join(query.split()).encode("utf-8")).hexdigest()[:12]
+
+
+def _dump_key(value):
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"decimal": str(value)}
+    return value
+
+
+def _load_key(value):
+    if isinstance(value, dict):
+        (kind, raw), = value.items()
+        return Decimal(raw) if kind == "decimal" else _DATE_TYPES[kind].fromisoformat(raw)
+    return value
+
+
+def encode_token(query, page):
+    payload = {"o": page["offset"], "h": _digest(query)}
+    if page["key"] is not None:
+        payload["k"] = [_dump_key(value) for value in page["key"]]
+    payload = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_token(query, token):
+    """
+    Return the page stored in token ({"offset": rows already returned, "key":
+    ORDER BY values of the last row or None}), checking it was issued for query.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        offset = int(payload["o"])
+        key = [_load_key(value) for value in payload["k"]] if "k" in payload else None
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise InvalidPageToken("page_token is malformed") from e
+    if payload.get("h") != _digest(query) or offset < 0:
+        raise InvalidPageToken("page_token does not belong to this query")
+    return {"offset": offset, "key": key}
+
+
+def _top_level(query):
+    """
+    Return query with comments, quoted text and parenthesised parts blanked
+    out (same length), so clause keywords found in it belong to the outer
+    statement rather than a subquery, window or string literal.
+    """
+    out, i, depth, quote = [], 0, 0, None
+    while i < len(query):
+        char = query[i]
+        if quote:
+            if char == "\\" and quote != "`" and i + 1 < len(query):
+                out.append("  ")
+                i += 2
+                continue
+            if char == quote:
+                quote = None
+            out.append(" ")
+        elif query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            end = len(query) if end < 0 else end + 2
+            out.append(" " * (end - i))
+            i = end
+            continue
+        elif char in "'\"`":
+            quote = char
+            out.append(" ")
+        elif char == "(":
+            depth += 1
+            out.append(" ")
+        elif char == ")":
+            depth -= 1
+            out.append(" ")
+        else:
+            out.append(char if depth == 0 else " ")
+        i += 1
+    return "".join(out)
+
+
+def _unquote(identifier):
+    return identifier[1:-1] if identifier[:1] in "`\"" else identifier
+
+
+def _order_terms(clause, flat):
+    """
+    Return [(name, descending)] for an ORDER BY clause. name is None for terms
+    that can't be matched to an output column: expressions, positions, and
+    qualified columns (t.id), which may differ from an output alias "id".
+    """
+    terms, start = [], 0
+    for end in [m.start() for m in re.finditer(",", flat)] + [len(clause)]:
+        match = _ORDER_TERM.match(clause[start:end].strip())
+        if match and not match.group(1) and not match.group(2).isdigit():
+            terms.append((_unquote(match.group(2)), (match.group(3) or "").lower() == "desc"))
+        else:
+            terms.append((None, False))
+        start = end + 1
+    return terms
+
+
+def _split(query):
+    """
+    Split a SELECT into (body, order_by, own_limit, lock). body has the outer
+    ORDER BY, LIMIT and locking clause removed; order_by is the list of
+    ORDER BY terms, [] without ORDER BY.
+    """
+    flat = _top_level(query)
+    lock = ""
+    match = _TRAILING_LOCK.search(flat)
+    if match:
+        query, flat, lock = query[:match.start()].rstrip(), flat[:match.start()].rstrip(), query[match.start():]
+
+    own_limit = None
+    match = _TRAILING_LIMIT.search(flat)
+    if match:
+        own_limit = query[match.start():]
+        query, flat = query[:match.start()].rstrip(), flat[:match.start()].rstrip()
+
+    matches = list(_ORDER_BY.finditer(flat))
+    if not matches:
+        return query, [], own_limit, lock
+    start, end = matches[-1].start(), matches[-1].end()
+    return query[:start].rstrip(), _order_terms(query[end:], flat[end:]), own_limit, lock
+
+
+def _key_columns(columns, order_by):
+    """
+    Positions in the result of the ORDER BY columns, or None when one of
+    them isn't an unambiguous output column.
+    """
+    if not order_by or len(set(columns)) != len(columns):
+        return None
+    if any(name is None or name not in columns for name, _ in order_by):
+        return None
+    return [columns.index(name) for name, _ in order_by]
+
+
+def _keyset_query(conn, body, order_by, key):
+    """
+    Wrap body so it returns the rows after key in ORDER BY order. NULLs sort
+    first in MySQL and SQLite, so for a DESC column they come after any key.
+    Column names come from the query itself, never from the token.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    names = [quote(name) for name, _ in order_by]
+    params = {f"_page_k{i}": value for i, value in enumerate(key)}
+    branches = []
+    for i, (name, (_, descending)) in enumerate(zip(names, order_by)):
+        equal = [f"{names[j]} = :_page_k{j}" for j in range(i)]
+        after = f"{name} < :_page_k{i} OR {name} IS NULL" if descending else f"{name} > :_page_k{i}"
+        branches.append("(" + " AND ".join(equal + [f"({after})"]) + ")")
+    ordering = ", ".join(f"{name} {'DESC' if descending else 'ASC'}" for name, (_, descending) in zip(names, order_by))
+    query = f"SELECT * FROM ({body}) AS _page WHERE {' OR '.join(branches)} ORDER BY {ordering} LIMIT :_page_limit"
+    return query, params
+
+
+def fetch_page(conn, query, page=None):
+    """
+    Run a SELECT and return (columns, rows, next_page) for one page of its result.
+
+    A page holds at most MAX_ROWS rows and MAX_BYTES of rendered output.
+    Rows are streamed with fetchmany, so the full result set is never held in
+    memory. next_page is None on the last page; otherwise it is
+    {"offset", "key", "ordered"} for encode_token.
+
+    Only queries with an ORDER BY can be paged: without one the database may
+    return rows in a different order on the next call, so next_page has
+    ordered=False and no token should be issued. When the ORDER BY lists
+    output columns, later pages continue after the last row's values
+    (keyset), so they neither re-read earlier rows nor shift when rows are
+    inserted; the ORDER BY should end with a unique column such as id.
+    Other ordered queries page by OFFSET; a query with its own LIMIT is
+    read up to that LIMIT and earlier rows are skipped while streaming.
+    """
+    page = page or {"offset": 0, "key": None}
+    query = query.strip().rstrip(";")
+    body, order_by, own_limit, lock = _split(query)
+    offset, skip, params = page["offset"], 0, {"_page_limit": MAX_ROWS + 1}
+
+    if own_limit is not None:
+        skip, params = offset, {}
+    elif page["key"] is not None:
+        if lock or not order_by or any(name is None for name, _ in order_by) or len(order_by) != len(page["key"]):
+            raise InvalidPageToken("page_token does not belong to this query")
+        query, key_params = _keyset_query(conn, body, order_by, page["key"])
+        params.update(key_params)
+    else:
+        head = query[:len(query) - len(lock)].rstrip() if lock else query
+        query = f"{head} LIMIT :_page_limit OFFSET :_page_offset {lock}".rstrip()
+        params["_page_offset"] = offset
+
+    result = conn.execution_options(stream_results=True, max_row_buffer=FETCH_SIZE).execute(text(query), params)
+    columns = list(result.keys())
+    rows, size, has_more = [], 0, False
+    try:
+        while not has_more:
+            batch = result.fetchmany(FETCH_SIZE)
+            if not batch:
+                break
+            for row in batch:
+                if skip:
+                    skip -= 1
+                    continue
+                row_size = len(repr(tuple(row))) + 2
+                if len(rows) >= MAX_ROWS or (rows and size + row_size > MAX_BYTES):
+                    has_more = True
+                    break
+                rows.append(row)
+                size += row_size
+    finally:
+        result.close()
+
+    metrics.add_rows(len(rows))
+    if not has_more:
+        return columns, rows, None
+
+    key = None
+    positions = _key_columns(columns, order_by) if own_limit is None and not lock else None
+    if positions is not None:
+        key = [rows[-1][position] for position in positions]
+        if any(value is None or isinstance(value, (bytes, bytearray, memoryview)) for value in key):
+            key = None
+    next_page = {"offset": offset + len(rows), "key": key, "ordered": bool(order_by)}
+    return columns, rows, next_page
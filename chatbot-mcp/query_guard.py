@@ -0,0 +1,208 @@
+"""
+Pre-execution checks for the SQL that execute_query receives from the model.
+
+parse() strips comments and rejects multiple statements and statement types
+other than SELECT / WITH / INSERT / UPDATE. check() asks the database for
+its plan (EXPLAIN, MySQL only) and rejects statements whose estimated rows
+scanned exceed QUERY_MAX_SCAN_ROWS. limits() bounds how long the statement
+may run: reads get a server-side execution timeout, writes a lock-wait
+timeout. Plans are cached by normalised statement text.
+"""
+
+import os
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+import pagination
+from cache import TTLCache
+
+MAX_SCAN_ROWS = int(os.getenv("QUERY_MAX_SCAN_ROWS", "100000"))
+TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", "5000"))
+LOCK_WAIT_SECONDS = int(os.getenv("QUERY_LOCK_WAIT_SECONDS", "5"))
+ALLOWED_KINDS = ("SELECT", "WITH", "INSERT", "UPDATE")
+READ_KINDS = ("SELECT", "WITH")
+
+# Shapes where the page LIMIT also bounds the rows read: anything else has to
+# read every candidate row before the first one comes back. A bounded query
+# whose filter matches too few rows to fill the page is left to the timeout.
+_UNBOUNDED = re.compile(
+    r"\b(JOIN|GROUP\s+BY|ORDER\s+BY|DISTINCT|UNION|HAVING|COUNT|SUM|AVG|MIN|MAX)\b|\bSELECT\b.*\bSELECT\b",
+    re.IGNORECASE | re.DOTALL,
+)
+_LIMIT = re.compile(r"\bLIMIT\s+(\d+)(?:\s*,\s*(\d+)|\s+OFFSET\s+(\d+))?\s*$", re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+
+plans = TTLCache(
+    maxsize=int(os.getenv("QUERY_GUARD_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("QUERY_GUARD_CACHE_TTL", "300")),
+)
+
+
+class QueryRejected(ValueError):
+    pass
+
+
+def _strip(query):
+    """
+    Remove comments and a trailing semicolon, raising QueryRejected if
+    another statement follows. Quoted text is left untouched.
+    """
+    out, i, quote = [], 0, None
+    while i < len(query):
+        char = query[i]
+        if quote:
+            out.append(char)
+            if char == "\\" and quote != "`" and i + 1 < len(query):
+                out.append(query[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+            out.append(char)
+        elif query.startswith("--", i) or char == "#":
+            end = query.find("\n", i)
+            i = len(query) if end < 0 else end
+            continue
+        elif query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            i = len(query) if end < 0 else end + 2
+            out.append(" ")
+            continue
+        elif char == ";":
+            if query[i + 1:].strip():
+                raise QueryRejected("Only one statement per execute_query call is allowed")
+            break
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out).strip()
+
+
+def _with_verb(statement):
+    """
+    Return the statement verb after the CTE list of a WITH statement
+    (SELECT, UPDATE, DELETE, ...), or None if it can't be found. Subqueries,
+    column lists and quoted names are blanked out first, so only the outer
+    statement is read.
+    """
+    tokens = re.findall(r"\w+|,", pagination._top_level(statement).upper())
+    i = 2 if tokens[1:2] == ["RECURSIVE"] else 1
+    while i < len(tokens):
+        if tokens[i] != "AS":
+            i += 1  # the CTE name; a quoted one is blanked out
+        if tokens[i:i + 1] != ["AS"]:
+            return None
+        i += 1
+        if tokens[i:i + 1] != [","]:
+            return tokens[i] if i < len(tokens) else None
+        i += 1
+    return None
+
+
+def parse(query):
+    """
+    Return (statement, kind) for query, or raise QueryRejected. A WITH
+    statement is classified by the statement after its CTEs: "WITH" when that
+    is a SELECT, otherwise its verb, so WITH ... UPDATE is a write and WITH ...
+    DELETE is rejected like DELETE.
+    """
+    statement = _strip(query)
+    if not statement:
+        raise QueryRejected("Query is empty")
+    kind = re.match(r"\w*", statement).group().upper()
+    if kind == "WITH":
+        verb = _with_verb(statement)
+        if verb is None:
+            raise QueryRejected("Could not find the statement after the WITH clause")
+        if verb != "SELECT":
+            kind = verb
+    if kind == "DELETE":
+        raise QueryRejected("Delete is not allowed")
+    if kind not in ALLOWED_KINDS:
+        raise QueryRejected(f"{kind} statements are not allowed. Use SELECT, INSERT or UPDATE")
+    return statement, kind
+
+
+def estimate_rows(conn, statement):
+    """
+    Estimate rows examined from MySQL's EXPLAIN: tables sharing a select id
+    are joined, so their row counts multiply; separate selects add up.
+    None when the dialect gives no estimate.
+    """
+    if conn.dialect.name != "mysql":
+        return None
+    selects = defaultdict(lambda: 1)
+    for row in conn.execute(text(f"EXPLAIN {statement}")).mappings():
+        if row["rows"] is not None:
+            selects[row["id"]] *= max(int(row["rows"]), 1)
+    return sum(selects.values())
+
+
+def _plan(conn, statement, kind):
+    key = " ".join(statement.split())
+    plan = plans.get(key)
+    if plan is None:
+        searchable = _LITERAL.sub("''", statement)
+        limit = _LIMIT.search(searchable)
+        plan = {
+            "estimated_rows": estimate_rows(conn, statement),
+            "bounded": kind in READ_KINDS and not _UNBOUNDED.search(searchable),
+            "limit_rows": sum(int(value) for value in limit.groups() if value) if limit else None,
+        }
+        plans.set(key, plan)
+    return plan
+
+
+def check(conn, statement, kind, offset=0):
+    """
+    Return the statement to execute, or raise QueryRejected if its plan
+    scans more than MAX_SCAN_ROWS rows.
+    """
+    plan = _plan(conn, statement, kind)
+    scanned = plan["estimated_rows"]
+    if scanned is not None and scanned > MAX_SCAN_ROWS and plan["bounded"]:
+        # The query's own LIMIT, or the one fetch_page adds, stops the scan early.
+        scanned = plan["limit_rows"] if plan["limit_rows"] is not None else offset + pagination.MAX_ROWS + 1
+    if scanned is not None and scanned > MAX_SCAN_ROWS:
+        raise QueryRejected(
+            f"Query rejected: it would scan about {scanned} rows (limit {MAX_SCAN_ROWS}). "
+            "Filter on an indexed column such as id or user_id, or add a LIMIT."
+        )
+    return statement
+
+
+@contextmanager
+def limits(conn, kind):
+    """
+    Bound the statements run on conn inside the block (MySQL only). Reads,
+    SELECT and WITH alike, get max_execution_time, which also covers the
+    derived table pagination wraps them in; writes get
+    innodb_lock_wait_timeout so they fail fast instead of queueing behind a
+    lock. The session value is restored afterwards, because the connection
+    goes back to the pool.
+    """
+    if conn.dialect.name != "mysql":
+        yield
+        return
+    if kind in READ_KINDS:
+        variable, value = "max_execution_time", TIMEOUT_MS
+    else:
+        variable, value = "innodb_lock_wait_timeout", LOCK_WAIT_SECONDS
+    if value <= 0:
+        yield
+        return
+
+    previous = conn.execute(text(f"SELECT @@SESSION.{variable}")).scalar()
+    conn.execute(text(f"SET SESSION {variable} = :value"), {"value": value})
+    try:
+        yield
+    finally:
+        try:
+            conn.execute(text(f"SET SESSION {variable} = :value"), {"value": previous})
+        except Exception:
+            # Don't hand a connection with the changed limit back to the pool.
+            conn.invalidate()
@@ -1,5 +1,78 @@
-def system_prompt():
-    return """
+import hashlib
+import json
+import re
+import threading
+import time
+
+from sqlalchemy import inspect
+
+# Tables described to the model, in prompt order. The types and descriptions
+# are the static fallback used when the schema cannot be reflected; reflected
+# columns reuse the descriptions by name.
+SCHEMA = {
+    "users": [
+        ("id", "INT (PK)", "Auto-increment user ID"),
+        ("name", "VARCHAR(50)", "Full name of the user"),
+        ("phone_number", "VARCHAR(18)", "Phone number"),
+        ("email", "VARCHAR(50)", "Unique email address (used as identifier)"),
+        ("address", "TEXT", "User's address"),
+        ("created_at", "TIMESTAMP", "When the user account was created"),
+        ("updated_at", "TIMESTAMP", "When the user account was updated"),
+    ],
+    "tickets": [
+        ("id", "INT (PK)", "Auto-increment ticket ID"),
+        ("user_id", "INT (FK)", "References `users.id`"),
+        ("title", "TEXT", "Short title of the issue"),
+        ("description", "TEXT", "Detailed description of the problem"),
+        ("category", "VARCHAR(25)", ""),
+        ("status", "VARCHAR(20)", ""),
+        ("priority", "VARCHAR(15)", ""),
+        ("created_at", "TIMESTAMP", "Set automatically when ticket is created"),
+        ("updated_at", "TIMESTAMP", "Set automatically when ticket is updated"),
+    ],
+    "faq_docs": [
+        ("id", "INT (PK)", "Auto-increment faq ID"),
+        ("question", "TEXT", "Question text"),
+        ("answer", "TEXT", "Answer text"),
+        ("category", "VARCHAR(25)", ""),
+        ("created_at", "TIMESTAMP", "Set automatically when faq is created"),
+    ],
+    "ticket_logs": [
+        ("id", "INT (PK)", "Auto-increment ticket log ID"),
+        ("ticket_id", "INT (FK)", "References `tickets.id`"),
+        ("action", "VARCHAR(15)", ""),
+        ("old_value", "TEXT", "The old value of the field"),
+        ("new_value", "TEXT", "The new value of the field"),
+        ("created_at", "TIMESTAMP", "Set automatically when ticket log is created"),
+    ],
+    "chat_history": [
+        ("id", "INT (PK)", "Auto-increment chat history ID"),
+        ("user_id", "INT (FK)", "References `users.id`"),
+        ("session_id", "VARCHAR(100)", "Session ID"),
+        ("role", "VARCHAR(15)", ""),
+        ("message", "TEXT", "The message from the user"),
+        ("created_at", "TIMESTAMP", "Set automatically when chat is created"),
+    ],
+    "ticket_stats": [
+        ("status", "VARCHAR(20) (PK)", "Ticket status"),
+        ("category", "VARCHAR(25) (PK)", "Ticket category"),
+        ("priority", "VARCHAR(15) (PK)", "Ticket priority"),
+        ("total", "INT", "Number of tickets in this group; read it with `ticket_stats`"),
+    ],
+}
+
+# Allowed values of VARCHAR columns used as enums. main.py adds the ticket
+# category and priority from the values create_ticket accepts.
+ENUMS = {
+    ("tickets", "status"): ["open", "in_progress", "resolved"],
+    ("faq_docs", "category"): ["internet", "signal", "billing"],
+    ("ticket_logs", "action"): ["created", "updated", "resolved"],
+    ("chat_history", "role"): ["user", "assistant"],
+}
+
+_TYPE_OPTIONS = re.compile(r"\s+(COLLATE|CHARACTER SET)\b.*$", re.IGNORECASE)
+
+PROMPT = """
     You are a helpful customer support assistant for an ISP (Internet Service Provider) called BFiber.
     You help users submit and track support tickets.
 
@@ -7,58 +80,7 @@ def system_prompt():
 
     ## Database Schema
 
-    ### Table: `users`
-    | Column       | Type         | Description                               |
-    |--------------|--------------|-------------------------------------------|
-    | id           | INT (PK)     | Auto-increment user ID                    |
-    | name         | VARCHAR(50)  | Full name of the user                     |
-    | phone_number | VARCHAR(18)  | Phone number                              |
-    | email        | VARCHAR(50)  | Unique email address (used as identifier) |
-    | address      | TEXT         | User's address                            |
-    | created_at   | TIMESTAMP    | When the user account was created         |
-    | updated_at   | TIMESTAMP    | When the user account was updated         |
-
-    ### Table: `tickets`
-    | Column      | Type         | Description                                     |
-    |-------------|--------------|-------------------------------------------------|
-    | id          | INT (PK)     | Auto-increment ticket ID                        |
-    | user_id     | INT (FK)     | References `users.id`                           |
-    | title       | TEXT         | Short title of the issue                        |
-    | description | TEXT         | Detailed description of the problem             |
-    | category    | VARCHAR(25)  | One of: `internet`, `signal`, `billing`         |
-    | status      | VARCHAR(20)  | One of: `open`, `in_progress`, `resolved`       |
-    | priority    | VARCHAR(15)  | One of: `low`, `medium`, `high`                 |
-    | created_at  | TIMESTAMP    | Set automatically when ticket is created        |
-    | updated_at  | TIMESTAMP    | Set automatically when ticket is updated        |
-
-    ### Table: `faq_docs`
-    | Column     | Type         | Description                             |
-    |------------|--------------|-----------------------------------------|
-    | id         | INT (PK)     | Auto-increment faq ID                   |
-    | question   | TEXT         | Question text                           |
-    | answer     | TEXT         | Answer text                             |
-    | category   | VARCHAR(25)  | One of: `internet`, `signal`, `billing` |
-    | created_at | TIMESTAMP    | Set automatically when faq is created   |
-
-    ### Table: `ticket_logs`
-    | Column     | Type         | Description                                  |
-    |------------|--------------|----------------------------------------------|
-    | id         | INT (PK)     | Auto-increment ticket log ID                 |
-    | ticket_id  | INT (FK)     | References `tickets.id`                      |
-    | action     | VARCHAR(15)  | One of: `created`, `updated`, `resolved`     |
-    | old_value  | TEXT         | The old value of the field                   |
-    | new_value  | TEXT         | The new value of the field                   |
-    | created_at | TIMESTAMP    | Set automatically when ticket log is created |
-
-    ### Table: `chat_history`
-    | Column     | Type         | Description                                    |
-    |------------|--------------|------------------------------------------------|
-    | id         | INT (PK)     | Auto-increment chat history ID                 |
-    | user_id    | INT (FK)     | References `users.id`                          |
-    | session_id | VARCHAR(100) | Session ID                                     |
-    | role       | VARCHAR(15)  | One of: `user`, `assistant`                    |
-    | message    | TEXT         | The message from the user                      |
-    | created_at | TIMESTAMP    | Set automatically when chat is created         |
+{schema}
 
     ---
 
@@ -76,6 +98,7 @@ def system_prompt():
       - `find_user` returns  → `"User found: ID=3, name=Budi, email=..."`  → user_id = 3
       - `create_user` returns → `"User created successfully! User ID: 7"`   → user_id = 7
       Extract the integer and store it. Use ONLY that value for `create_ticket`.
+      If tools return JSON instead, read `user.id` from `find_user` and `user_id` from `create_user`.
 
     - **RULE 4: Do NOT use `execute_query` to look up or insert users.**
       `find_user` and `create_user` are the ONLY authorized tools for the `users` table.
@@ -99,12 +122,7 @@ def system_prompt():
     #### If `find_user` returns "User found: ID=X, name=Y, ...":
     - Store user_id = X
     - Greet: "Halo, [name]! Senang bertemu lagi."
-    - Check their latest ticket with `execute_query`:
-      ```sql
-      SELECT id, title, category, status, priority, created_at
-      FROM tickets WHERE user_id = X
-      ORDER BY created_at DESC LIMIT 1
-      ```
+    - Check their latest ticket with `get_latest_ticket(user_id=X)`.
     - If latest ticket is `open` or `in_progress` → show summary (see Case B1 below)
     - If latest ticket is `resolved` or no tickets → proceed to STEP 3
 
@@ -136,12 +154,13 @@ def system_prompt():
     1. Ask the user to describe their problem in detail.
     2. Auto-detect **category** from keywords:
        - "internet", "lambat", "disconnect", "wifi", "modem", "3rd party", "restart", "login", "progress" → `technical support`
-       - "upgrade", "downgrade", "add-on" → `upgrade/downgrade`
        - "tagihan", "billing", "bayar", "invoice", "suspend" → `billing`
-       - "registrasi", "promo", "jangkauan", "coverage", "list paket", "metode pembayaran" -> `faq`
-       - "alamat", "update" -> `account management`
-       - "refund", "kompensasi", "berhenti berlangganan" -> `retention & experience`
+       - "alamat", "update", "upgrade", "downgrade", "add-on" → `account management`
+       - "refund", "kompensasi", "berhenti berlangganan" → `retention & experience`
+       - "registrasi", "promo", "jangkauan", "coverage", "list paket", "metode pembayaran" → not a ticket:
+         these are questions, answer them with `search_faq`.
     2a. If no one of the above keywords is matched, ask the user to relate their problem to the above categories.
+        Only use the `tickets.category` values listed in the schema.
     3. Auto-detect **priority** from urgency:
        - "tidak bisa sama sekali", "mati total", "darurat" → `high`
        - "kadang-kadang", "sering putus", "lumayan lambat" → `medium`
@@ -174,17 +193,51 @@ def system_prompt():
     2. You have collected name, phone_number, and address from the user.
     - Returns `"User created successfully! User ID: X"` → store this ID.
 
+    ### `get_latest_ticket(user_id)`
+    Returns the user's most recent ticket (id, title, category, status, priority, created_at).
+    - Use this instead of `execute_query` to check a returning user's latest ticket.
+
     ### `create_ticket(user_id, title, description, category, priority)`
     Creates a support ticket.
     - `user_id` MUST come from `find_user` or `create_user` — NEVER invented.
     - `status` is auto-set to `open`.
+    - A `created` row is written to `ticket_logs` automatically — do not insert it yourself.
     - Call only AFTER user confirms the ticket details.
 
-    ### `execute_query(query: str)`
+    ### `update_ticket_status(ticket_id, status)`
+    Changes a ticket's status (`open`, `in_progress`, `resolved`) and logs it in `ticket_logs`.
+    - Use this instead of `execute_query` UPDATEs for status changes.
+
+    ### `ticket_stats(status="", category="", priority="")`
+    Counts tickets by status, category and priority, e.g. "how many open high-priority billing tickets".
+    - Every filter is optional. Use this instead of `COUNT(*)` queries through `execute_query`.
+
+    ### `execute_query(query: str, page_token: str = "")`
     For SELECT queries (read-only lookups, ticket history, etc.).
+    Results are paginated. If the response says more rows are available, call it again
+    with the same query and the returned `page_token` — only when you actually need more rows.
+    Only queries with an `ORDER BY` can be paged; end it with a unique column, e.g.
+    `ORDER BY created_at DESC, id DESC`.
     INSERT/UPDATE allowed only for non-user tables.
+    One statement per call. Queries that would scan too many rows are rejected — filter on
+    indexed columns (`id`, `user_id`, `ticket_id`) and prefer the dedicated tools.
     Do NOT use for the `users` table.
 
+    ### `search_faq(question, top_k=3)`
+    Searches the FAQ knowledge base for answers to general questions
+    (registrasi, promo, jangkauan, paket, metode pembayaran, ...).
+    Use this before `execute_query` when the user asks a question instead of reporting a problem.
+
+    ### `chat_cat(message)` / `chat_cat_batch(messages)`
+    Classifies a message as `complaint`, `question` or `chitchat` locally, in milliseconds,
+    and suggests the ticket category and priority from the STEP 3 keywords.
+    - Only a `complaint` may lead to `create_ticket`; answer a `question` with `search_faq`.
+    - Still confirm the suggested category and priority with the user.
+
+    ### `log_chat_message(user_id, session_id, role, message)`
+    Records a message in `chat_history` (`role` is `user` or `assistant`).
+    It is queued and written in the background, so it never delays your reply.
+
     ### `save_faq_docs()`
     Syncs FAQ data to the vector store.
     Use only when the user explicitly asks to refresh FAQ.
@@ -201,3 +254,127 @@ def system_prompt():
     6. Never execute data changes without user confirmation.
     7. DELETE is forbidden — use soft-delete (UPDATE status) instead.
     """
+
+
+def _render_table(name, columns):
+    header = ("Column", "Type", "Description")
+    widths = [max(len(row[i]) for row in [header, *columns]) for i in range(3)]
+
+    def line(row):
+        return "| " + " | ".join(value.ljust(width) for value, width in zip(row, widths)) + " |"
+
+    separator = "|" + "|".join("-" * (width + 2) for width in widths) + "|"
+    return [f"### Table: `{name}`", line(header), separator, *(line(column) for column in columns)]
+
+
+def render_schema(tables, enums=None):
+    """
+    Render {table: [(column, type, description)]} as the prompt's markdown tables.
+    """
+    enums = {**ENUMS, **(enums or {})}
+    sections = []
+    for name, columns in tables.items():
+        described = []
+        for column, type_name, description in columns:
+            values = enums.get((name, column))
+            if values:
+                allowed = "One of: " + ", ".join(f"`{value}`" for value in values)
+                description = f"{description}. {allowed}" if description else allowed
+            described.append((column, type_name, description))
+        if sections:
+            sections.append("")
+        sections += _render_table(name, described)
+    # Indented to match the rest of PROMPT.
+    return "\n".join(f"    {line}" if line else "" for line in sections)
+
+
+def _type_name(column):
+    try:
+        return _TYPE_OPTIONS.sub("", str(column["type"]))
+    except Exception:
+        return type(column["type"]).__name__.upper()
+
+
+def reflect(conn):
+    """
+    Return the live schema as {table: [(column, type, description)]}, known
+    tables first in SCHEMA order. Descriptions come from column comments,
+    then from SCHEMA, then from foreign keys.
+    """
+    inspector = inspect(conn)
+    names = inspector.get_table_names()
+    ordered = [name for name in SCHEMA if name in names] + sorted(name for name in names if name not in SCHEMA)
+
+    tables = {}
+    for name in ordered:
+        notes = {column: description for column, _, description in SCHEMA.get(name, [])}
+        primary = set(inspector.get_pk_constraint(name).get("constrained_columns") or [])
+        foreign = {}
+        for key in inspector.get_foreign_keys(name):
+            for column, referred in zip(key["constrained_columns"], key["referred_columns"]):
+                foreign[column] = f"References `{key['referred_table']}.{referred}`"
+
+        columns = []
+        for column in inspector.get_columns(name):
+            type_name = _type_name(column)
+            if column["name"] in primary:
+                type_name += " (PK)"
+            elif column["name"] in foreign:
+                type_name += " (FK)"
+            description = column.get("comment") or notes.get(column["name"]) or foreign.get(column["name"], "")
+            values = getattr(column["type"], "enums", None)
+            if values:
+                description = "One of: " + ", ".join(f"`{value}`" for value in values)
+            columns.append((column["name"], type_name, description))
+        tables[name] = columns
+    return tables
+
+
+def system_prompt(tables=None, enums=None):
+    return PROMPT.replace("{schema}", render_schema(tables or SCHEMA, enums))
+
+
+class PromptCache:
+    """
+    The rendered system prompt, versioned by a hash of its text.
+
+    refresh() reflects the schema at most once per check_interval seconds
+    (0 means only the first time) and re-renders the prompt only when the
+    reflected schema differs from the one it was built from. Until a
+    reflection succeeds, the static SCHEMA is used.
+    """
+
+    def __init__(self, enums=None, check_interval=300):
+        self.enums = enums
+        self.check_interval = check_interval
+        self.source = "static"
+        self.fingerprint = None
+        self.checked_at = None
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._build(SCHEMA)
+
+    def _build(self, tables):
+        self.prompt = system_prompt(tables, self.enums)
+        self.version = hashlib.sha256(self.prompt.encode("utf-8")).hexdigest()[:16]
+        self.built_at = time.time()
+
+    def stale(self):
+        if self.checked_at is None:
+            return True
+        return self.check_interval > 0 and time.monotonic() - self.checked_at >= self.check_interval
+
+    def mark_checked(self):
+        with self._lock:
+            self.checked_at = time.monotonic()
+
+    def refresh(self, conn):
+        tables = reflect(conn)
+        fingerprint = hashlib.sha256(json.dumps(tables).encode("utf-8")).hexdigest()
+        with self._lock:
+            self.checked_at = time.monotonic()
+            if tables and fingerprint != self.fingerprint:
+                self.fingerprint = fingerprint
+                self.source = "database"
+                self._build(tables)
+        return self.prompt
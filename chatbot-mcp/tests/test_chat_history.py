@@ -0,0 +1,22 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from chat_history import ChatHistoryWriter
+
+
+def test_bad_row_fails_alone():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE chat_history (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL,"
+            " session_id TEXT, role TEXT, message TEXT, created_at TEXT)"
+        ))
+    writer = ChatHistoryWriter(engine, flush_interval=0.1)
+    for user_id in [1, 2, None, 3]:
+        writer.log(user_id, "s", "user", "hi")
+    writer.close()
+
+    stats = writer.stats()
+    assert (stats["written"], stats["failed"]) == (3, 1)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM chat_history")).scalar() == 3
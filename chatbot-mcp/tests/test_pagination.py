@@ -0,0 +1,23 @@
+import pagination
+
+
+def test_split_plain_select():
+    assert pagination._split("SELECT * FROM users") == ("SELECT * FROM users", [], None, "")
+
+
+def test_split_order_limit_and_lock():
+    body, order_by, own_limit, lock = pagination._split("SELECT id, name FROM users ORDER BY name DESC, id LIMIT 5 FOR UPDATE")
+    assert body == "SELECT id, name FROM users"
+    assert order_by == [("name", True), ("id", False)]
+    assert own_limit == "LIMIT 5"
+    assert lock == "FOR UPDATE"
+
+
+def test_split_ignores_subqueries_and_strings():
+    query = "SELECT * FROM (SELECT id FROM t ORDER BY id LIMIT 3) s WHERE note = 'order by x'"
+    assert pagination._split(query) == (query, [], None, "")
+
+
+def test_split_marks_unmatchable_order_terms():
+    _, order_by, _, _ = pagination._split("SELECT u.id FROM users u ORDER BY u.id, 2, `name` ASC")
+    assert order_by == [(None, False), (None, False), ("name", False)]
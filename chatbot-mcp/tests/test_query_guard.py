@@ -0,0 +1,41 @@
+import pytest
+import query_guard
+
+
+def test_strip_removes_comments_but_not_quoted_text():
+    assert query_guard._strip("SELECT 1 -- note\n/* block */") == "SELECT 1"
+    assert query_guard._strip("SELECT '-- not a comment' ;") == "SELECT '-- not a comment'"
+
+
+def test_strip_rejects_several_statements():
+    with pytest.raises(query_guard.QueryRejected):
+        query_guard._strip("SELECT 1; DELETE FROM tickets")
+
+
+def test_parse_kinds():
+    assert query_guard.parse("select * from users")[1] == "SELECT"
+    assert query_guard.parse("UPDATE users SET name = 'a' WHERE id = 1")[1] == "UPDATE"
+    assert query_guard.parse("WITH x AS (SELECT 1) SELECT * FROM x")[1] == "WITH"
+
+
+def test_parse_rejects_delete():
+    with pytest.raises(query_guard.QueryRejected):
+        query_guard.parse("DELETE FROM tickets")
+    with pytest.raises(query_guard.QueryRejected):
+        query_guard.parse("/* x */ DELETE FROM tickets")
+
+
+def test_parse_classifies_with_by_its_main_statement():
+    with pytest.raises(query_guard.QueryRejected):
+        query_guard.parse("WITH x AS (SELECT 1) DELETE FROM tickets")
+    with pytest.raises(query_guard.QueryRejected):
+        query_guard.parse("WITH a AS (SELECT 1), `b c` AS (SELECT 2) DELETE FROM tickets")
+    assert query_guard.parse("WITH x AS (SELECT 1) UPDATE users SET name = 'a'")[1] == "UPDATE"
+    assert query_guard.parse("WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x")[1] == "INSERT"
+    query = "WITH RECURSIVE c (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM c WHERE n < 5) SELECT * FROM c"
+    assert query_guard.parse(query)[1] == "WITH"
+
+
+def test_parse_rejects_incomplete_with():
+    with pytest.raises(query_guard.QueryRejected):
+        query_guard.parse("WITH x")
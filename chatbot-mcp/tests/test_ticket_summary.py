@@ -0,0 +1,44 @@
+from sqlalchemy import create_engine, text
+
+import ticket_summary
+
+
+def _assert_in_sync(conn):
+    with conn.begin():
+        counts = {tuple(row[:3]): row[3] for row in conn.execute(text(ticket_summary.COUNT_TICKETS))}
+        assert {row[:3]: row[3] for row in ticket_summary.summary(conn)} == counts
+
+
+def test_counters_follow_create_update_and_reconcile():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text(
+                "CREATE TABLE tickets (id INTEGER PRIMARY KEY, status TEXT, category TEXT, priority TEXT)"
+            ))
+            ticket_summary.create(conn)
+
+        # create_ticket
+        for category, priority in [("billing", "high"), ("billing", "high"), ("technical", "low")]:
+            with conn.begin():
+                conn.execute(
+                    text("INSERT INTO tickets (status, category, priority) VALUES ('open', :category, :priority)"),
+                    {"category": category, "priority": priority},
+                )
+                ticket_summary.adjust(conn, {("open", category, priority): 1})
+        _assert_in_sync(conn)
+
+        # update_ticket_status
+        with conn.begin():
+            conn.execute(text("UPDATE tickets SET status = 'closed' WHERE id = 1"))
+            ticket_summary.adjust(conn, {("open", "billing", "high"): -1, ("closed", "billing", "high"): 1})
+        _assert_in_sync(conn)
+        assert ticket_summary.reconcile(conn) == 0
+
+        # writes that bypass the counters are corrected by reconcile
+        with conn.begin():
+            conn.execute(text("UPDATE tickets SET priority = 'high' WHERE id = 3"))
+            conn.execute(text("INSERT INTO tickets (status, category, priority) VALUES ('open', 'account', 'medium')"))
+        assert ticket_summary.reconcile(conn) == 3
+        _assert_in_sync(conn)
+        assert ticket_summary.reconcile(conn) == 0
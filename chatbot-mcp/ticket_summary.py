@@ -0,0 +1,157 @@
+"""
+Ticket counts by (status, category, priority), kept in the ticket_stats table.
+
+Every write to tickets made by the tools adjusts the matching counter in the
+same transaction, so aggregate questions read a few dozen rows instead of
+scanning tickets. Reconciler recounts tickets periodically to correct drift from writes made outside the tools (execute_query, manual SQL).
+"""
+
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import inspect, text
+
+CREATE_TABLE = text("""
+    CREATE TABLE IF NOT EXISTS ticket_stats (
+        status VARCHAR(20) NOT NULL,
+        category VARCHAR(25) NOT NULL,
+        priority VARCHAR(15) NOT NULL,
+        total INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (status, category, priority)
+    )
+""")
+
+_UPSERT = {
+    "mysql": """
+        INSERT INTO ticket_stats (status, category, priority, total)
+        VALUES (:status, :category, :priority, :delta)
+        ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+    """,
+    # SQLite and PostgreSQL
+    "default": """
+        INSERT INTO ticket_stats (status, category, priority, total)
+        VALUES (:status, :category, :priority, :delta)
+        ON CONFLICT (status, category, priority) DO UPDATE SET total = ticket_stats.total + excluded.total
+    """,
+}
+
+SELECT_STATS = "SELECT status, category, priority, total FROM ticket_stats"
+COUNT_TICKETS = "SELECT status, category, priority, COUNT(*) FROM tickets GROUP BY status, category, priority"
+
+_available = None
+
+
+def available(conn):
+    """
+    Whether the ticket_stats table exists; checked once per process, so
+    writes keep working on a database that was never bootstrapped.
+    """
+    global _available
+    if _available is None:
+        _available = inspect(conn).has_table("ticket_stats")
+    return _available
+
+
+def create(conn):
+    global _available
+    conn.execute(CREATE_TABLE)
+    _available = True
+
+
+def adjust(conn, deltas):
+    """
+    Add deltas ({(status, category, priority): change}) to the counters.
+    Call inside the transaction that changes tickets.
+    """
+    rows = [
+        {"status": status, "category": category, "priority": priority, "delta": delta}
+        for (status, category, priority), delta in deltas.items()
+        if delta
+    ]
+    if rows and available(conn):
+        conn.execute(text(_UPSERT.get(conn.dialect.name, _UPSERT["default"])), rows)
+
+
+def summary(conn, status=None, category=None, priority=None):
+    """
+    Return [(status, category, priority, total)] for the non-empty groups
+    matching the given filters.
+    """
+    filters = {"status": status, "category": category, "priority": priority}
+    clauses = [f"{column} = :{column}" for column, value in filters.items() if value]
+    query = SELECT_STATS + " WHERE total > 0" + "".join(f" AND {clause}" for clause in clauses)
+    query += " ORDER BY status, category, priority"
+    return [tuple(row) for row in conn.execute(text(query), {k: v for k, v in filters.items() if v})]
+
+
+def reconcile(conn):
+    """
+    Correct ticket_stats from tickets and return how many groups had drifted.
+
+    Counters and ticket counts are read with plain (non-locking) SELECTs in
+    one transaction, so both come from the same snapshot and ticket writes
+    are never blocked. Only the drifted groups are then adjusted by their
+    difference rather than overwritten, which keeps any counter change a
+    tool committed in the meantime.
+    """
+    with conn.begin():
+        before = {tuple(row[:3]): row[3] for row in conn.execute(text(SELECT_STATS))}
+        drift = Counter({tuple(row[:3]): row[3] for row in conn.execute(text(COUNT_TICKETS))})
+    drift.subtract(before)
+    drift = {group: change for group, change in drift.items() if change}
+    if drift:
+        with conn.begin():
+            adjust(conn, drift)
+    return len(drift)
+
+
+class Reconciler:
+    """
+    Run reconcile() every interval seconds on a background thread.
+    """
+
+    def __init__(self, engine, interval=3600):
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "failures": 0, "drifted_groups": 0, "last_run": None, "last_seconds": None}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._run, name="ticket-stats-reconciler", daemon=True)
+                self._thread.start()
+
+    def close(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def run_once(self):
+        start = time.perf_counter()
+        try:
+            with self.engine.connect() as conn:
+                if not available(conn):
+                    return None
+                drifted = reconcile(conn)
+        except Exception:
+            with self._lock:
+                self._stats["failures"] += 1
+            return None
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["drifted_groups"] += drifted
+            self._stats["last_run"] = time.time()
+            self._stats["last_seconds"] = time.perf_counter() - start
+        return drifted
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
@@ -0,0 +1,68 @@
+"""
+Chroma client for the faq_docs collection.
+
+By default the server opens the persistent directory at CHROMA_PATH itself.
+That is only safe for a single process, so with CHROMA_HOST set every worker
+talks to one Chroma server instead; serve() starts that server as the single
+owner of CHROMA_PATH when none is running yet.
+"""
+
+import os
+import socket
+import subprocess
+import threading
+import time
+
+import chromadb
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./faq_db")
+COLLECTION_NAME = "faq_docs"
+
+_client = None
+_collection = None
+_lock = threading.Lock()
+
+
+def client():
+    """
+    Return the process-wide Chroma client, connecting on first use.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                host = os.getenv("CHROMA_HOST")
+                if host:
+                    _client = chromadb.HttpClient(host=host, port=int(os.getenv("CHROMA_PORT", "8000")))
+                else:
+                    _client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _client
+
+
+def collection():
+    global _collection
+    if _collection is None:
+        _collection = client().get_or_create_collection(name=COLLECTION_NAME)
+    return _collection
+
+
+def serve(host="127.0.0.1", port=8000, timeout=60):
+    """
+    Start `chroma run` over CHROMA_PATH and wait until it accepts connections.
+    Returns the server process; the caller terminates it on shutdown.
+    """
+    server = subprocess.Popen(
+        ["chroma", "run", "--path", CHROMA_PATH, "--host", host, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"chroma run exited with {server.returncode}")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"chroma run did not listen on {host}:{port} within {timeout}s")